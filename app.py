@@ -1,17 +1,31 @@
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 from datetime import datetime, date, timedelta
 import plotly.express as px
-import psycopg2
-from psycopg2.extras import RealDictCursor
 import os
 from typing import Optional, Tuple
 import re
-import bcrypt
 from dotenv import load_dotenv
-import uuid
 import hashlib
 import json
+import io
+from db import (execute_query, execute_query_one, fetch_frame, note_write, replica_ok, run_concurrently,
+                transaction)
+from cache import shop_cache
+from metrics import metrics, start_metrics_server
+from psycopg2.extras import RealDictCursor, execute_values
+from bulk_import import import_rows, load_product_map, parse_import_csv
+from export import DOWNLOAD_MAX_BYTES, EXPORT_FORMATS, spooled_sales_export
+from partitions import ensure_partitions
+from journal import write_journal
+from inventory import LOW_STOCK_THRESHOLD, apply_movements, get_inventory, set_low_stock_threshold
+from charts import downsample, downsample_series
+from reports import (COMPARISON_PERIODS, DETAIL_COLUMNS, REPORT_PAGE_SIZE, RECORD_SALES_SQL, SALES_REPORT_SQL,
+                     aggregate_sales, compare_periods, empty_aggregates, empty_comparison, sales_detail_page)
+from passwords import HashBusy, hash_password, needs_rehash, verify_password
+from sessions import (SESSION_COOKIE_NAME, SESSION_TTL_DAYS, create_session, resume_session,
+                      revoke_session, sessions_enabled)
 
 # Load environment variables from .env file
 load_dotenv()
@@ -71,99 +85,59 @@ def init_session():
         st.session_state['user_data'] = None
     if 'is_loading' not in st.session_state:
         st.session_state['is_loading'] = False
+    if 'basket' not in st.session_state:
+        st.session_state['basket'] = {}
+    if 'session_cookie' not in st.session_state:
+        st.session_state['session_cookie'] = None
 
 # Initialize session
 init_session()
 
-# Database connection functions
-def get_db_connection():
-    """Create and return a fresh database connection."""
-    database_url = os.getenv("DATABASE_URL")
-    if not database_url:
-        st.error("DATABASE_URL environment variable is required but not set.")
-        st.stop()
-        
-    try:
-        conn = psycopg2.connect(database_url)
-        return conn
-    except Exception as e:
-        st.error(f"Failed to connect to database: {e}")
-        st.stop()
-
-def execute_query(query: str, params: tuple = None, fetch: bool = False):
-    """Execute a database query and return results if fetch=True."""
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query, params)
-            if fetch:
-                return cur.fetchall()
-            conn.commit()
-            return cur.rowcount
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
-
-def execute_query_one(query: str, params: tuple = None):
-    """Execute a database query and return a single result."""
-    conn = get_db_connection()
-    try:
-        with conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query, params)
-            return cur.fetchone()
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+# Serve /metrics when METRICS_PORT is set (started once per process)
+start_metrics_server()
 
 # Authentication functions
-def hash_password(password: str) -> str:
-    """Hash a password using bcrypt."""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-def verify_password(password: str, hashed: str) -> bool:
-    """Verify a password against its hash."""
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+# hash_password / verify_password run bcrypt on a bounded pool (see passwords.py)
+SIGN_UP_SQL = """
+WITH new_user AS (
+    INSERT INTO users (email, password_hash)
+    VALUES (%s, %s)
+    ON CONFLICT (email) DO NOTHING
+    RETURNING id, email
+), new_shop AS (
+    INSERT INTO shops (id, shop_name)
+    SELECT id, %s FROM new_user
+    RETURNING id, shop_name
+)
+SELECT u.id, u.email, s.shop_name
+FROM new_user u
+JOIN new_shop s ON s.id = u.id
+"""
 
 def sign_up(email: str, password: str, shop_name: str) -> Tuple[Optional[dict], Optional[str]]:
     """Create a new user account and shop."""
     try:
-        # Check if user already exists
-        existing_user = execute_query_one(
-            "SELECT id FROM users WHERE email = %s",
-            (email,)
-        )
-        
-        if existing_user:
-            return None, "An account with this email already exists"
-        
         # Hash password
         password_hash = hash_password(password)
         
-        # Create user
-        user_id = str(uuid.uuid4())
-        execute_query(
-            "INSERT INTO users (id, email, password_hash) VALUES (%s, %s, %s)",
-            (user_id, email, password_hash)
-        )
+        # Create the user and shop in one statement; an existing email inserts nothing
+        with transaction(cursor_factory=RealDictCursor) as cur:
+            cur.execute(SIGN_UP_SQL, (email, password_hash, shop_name))
+            created = cur.fetchone()
         
-        # Create shop
-        execute_query(
-            "INSERT INTO shops (id, shop_name) VALUES (%s, %s)",
-            (user_id, shop_name)
-        )
+        if not created:
+            return None, "An account with this email already exists"
         
         user_data = {
-            'id': user_id,
-            'email': email,
-            'shop_name': shop_name
+            'id': created['id'],
+            'email': created['email'],
+            'shop_name': created['shop_name']
         }
         
         return user_data, None
         
+    except HashBusy as e:
+        return None, str(e)
     except Exception as e:
         return None, f"Sign up failed: {str(e)}"
 
@@ -183,6 +157,17 @@ def sign_in(email: str, password: str) -> Tuple[Optional[dict], Optional[str]]:
         if not verify_password(password, user['password_hash']):
             return None, "Invalid email or password"
         
+        # Upgrade hashes made with a different cost factor while we have the password
+        if needs_rehash(user['password_hash']):
+            try:
+                execute_query(
+                    "UPDATE users SET password_hash = %s WHERE id = %s",
+                    (hash_password(password), user['id'])
+                )
+            except Exception:
+                # Sign-in still succeeds; the rehash is retried next time
+                pass
+        
         user_data = {
             'id': user['id'],
             'email': user['email'],
@@ -191,24 +176,73 @@ def sign_in(email: str, password: str) -> Tuple[Optional[dict], Optional[str]]:
         
         return user_data, None
         
+    except HashBusy as e:
+        return None, str(e)
     except Exception as e:
         return None, f"Sign in failed: {str(e)}"
 
+def start_session(user_data: dict):
+    """Mark the user as signed in and issue a persistent session cookie."""
+    st.session_state['authenticated'] = True
+    st.session_state['user_id'] = user_data['id']
+    st.session_state['user_data'] = user_data
+    
+    if sessions_enabled():
+        try:
+            cookie_value = create_session(user_data['id'])
+            st.session_state['session_cookie'] = cookie_value
+            # Written on the next run, since sign-in reruns the script straight away
+            st.session_state['pending_cookie'] = cookie_value
+        except Exception:
+            # The sign-in still holds for this browser tab
+            pass
+
+def write_session_cookie(value: str):
+    """Set (or with an empty value, clear) the session cookie in the browser."""
+    max_age = SESSION_TTL_DAYS * 86400 if value else 0
+    components.html(
+        f"""<script>
+        window.parent.document.cookie = "{SESSION_COOKIE_NAME}={value}; Max-Age={max_age}; Path=/; SameSite=Strict"
+            + (window.parent.location.protocol === "https:" ? "; Secure" : "");
+        </script>""",
+        height=0
+    )
+
+def flush_session_cookie():
+    """Write any cookie change queued by sign in or sign out."""
+    if 'pending_cookie' in st.session_state:
+        write_session_cookie(st.session_state.pop('pending_cookie'))
+
+def resume_from_cookie() -> Optional[dict]:
+    """Resume a signed-in session from the browser's session cookie."""
+    # Only once per browser tab; the cookie does not change until the page reloads
+    if st.session_state.get('session_resume_tried') or not sessions_enabled():
+        return None
+    st.session_state['session_resume_tried'] = True
+    
+    cookie_value = st.context.cookies.get(SESSION_COOKIE_NAME)
+    user = resume_session(cookie_value)
+    if user:
+        st.session_state['authenticated'] = True
+        st.session_state['user_id'] = user['id']
+        st.session_state['user_data'] = user
+        st.session_state['session_cookie'] = cookie_value
+    return user
+
 def get_current_user() -> Optional[dict]:
-    """Get current user from session state."""
+    """Get current user from session state or the session cookie."""
     try:
+        if not st.session_state.get('authenticated'):
+            return resume_from_cookie()
+        
         # Check session state
         if st.session_state.get('authenticated') and st.session_state.get('user_id'):
             # Return cached user data if available
             if st.session_state.get('user_data'):
                 return st.session_state['user_data']
             
-            # Fetch user data from database
-            user_id = st.session_state['user_id']
-            user = execute_query_one(
-                "SELECT u.id, u.email, s.shop_name FROM users u LEFT JOIN shops s ON u.id = s.id WHERE u.id = %s",
-                (user_id,)
-            )
+            # Fetch user data from the shop cache or database
+            user = fetch_user(st.session_state['user_id'])
             
             # Cache user data in session
             if user:
@@ -223,14 +257,26 @@ def get_current_user() -> Optional[dict]:
 
 def sign_out():
     """Sign out the current user."""
+    # Revoke the server-side session and clear the browser cookie
+    cookie_value = st.session_state.get('session_cookie')
+    if cookie_value:
+        try:
+            revoke_session(cookie_value)
+        except Exception:
+            pass
+        st.session_state['pending_cookie'] = ''
+    st.session_state['session_cookie'] = None
+    
     # Clear all session state
     st.session_state['authenticated'] = False
     st.session_state['user_id'] = None
     st.session_state['user_data'] = None
     st.session_state['is_loading'] = False
+    st.session_state['basket'] = {}
+    discard_sales_export()
     
     # Clear any other session keys that might exist
-    keys_to_clear = [k for k in st.session_state.keys() if k.startswith('user_') or k in ['authenticated']]
+    keys_to_clear = [k for k in st.session_state.keys() if k.startswith(('user_', 'report_')) or k in ['authenticated']]
     for key in keys_to_clear:
         if key in st.session_state:
             del st.session_state[key]
@@ -238,117 +284,318 @@ def sign_out():
     st.rerun()
 
 # Database functions
+# fetch_* read through the shop cache and raise on errors, so they are safe to
+# run on worker threads (see prefetch_page); get_* wrap them for the page and
+# report errors with st.error. Report reads may use the read replica unless the
+# shop has just written (see shop_written).
+def shop_written(user_id: str):
+    """Drop a shop's cached reads and keep its reads on the primary until the replica catches up."""
+    note_write(str(user_id))
+    shop_cache.invalidate_shop(user_id)
+
+# Sales and stock updates go through the local write journal when it is
+# enabled (see journal.py); its flusher (started once per process) refreshes
+# each shop once their writes reach the database
+write_journal.start(on_applied=shop_written)
+
+def fetch_user(user_id: str) -> Optional[dict]:
+    """Load a user's email and shop name."""
+    return shop_cache.get_or_load(user_id, ('user',), lambda: execute_query_one(
+        "SELECT u.id, u.email, s.shop_name FROM users u LEFT JOIN shops s ON u.id = s.id WHERE u.id = %s",
+        (user_id,)
+    ))
+
+def fetch_products(user_id: str) -> pd.DataFrame:
+    """Load all products for a shop."""
+    return shop_cache.get_or_load(user_id, ('products',), lambda: pd.DataFrame(execute_query(
+        "SELECT id, name, buying_price, selling_price, created_at FROM products WHERE shop_id = %s ORDER BY created_at DESC",
+        (user_id,),
+        fetch=True,
+        replica=replica_ok(str(user_id))
+    )))
+
+def fetch_daily_profit(user_id: str, target_date: date) -> Tuple[float, pd.DataFrame]:
+    """Load daily profit and per-product sales for a specific date."""
+    return shop_cache.get_or_load(
+        user_id, ('daily_profit', target_date),
+        lambda: load_daily_profit(user_id, target_date)
+    )
+
+def fetch_period_comparison(user_id: str, target_date: date) -> dict:
+    """Load day, week, month and year-over-year comparisons ending on a date."""
+    return shop_cache.get_or_load(
+        user_id, ('comparison', target_date),
+        lambda: compare_periods(user_id, target_date, replica=replica_ok(str(user_id)))
+    )
+
+def fetch_sales_page(user_id: str, start_date: date, end_date: date, product_id: Optional[str] = None,
+                     sort: str = 'date', descending: bool = True,
+                     after: Optional[tuple] = None) -> Tuple[pd.DataFrame, Optional[tuple]]:
+    """Load one page of the sales report and the cursor for the next page."""
+    return shop_cache.get_or_load(
+        user_id,
+        ('sales_page', start_date, end_date, str(product_id) if product_id else None, sort, descending, after),
+        lambda: sales_detail_page(user_id, start_date, end_date, product_id, sort, descending, after,
+                                  replica=replica_ok(str(user_id)))
+    )
+
+def fetch_report_aggregates(user_id: str, start_date: date, end_date: date, product_id: Optional[str] = None,
+                            bucket: Optional[str] = None) -> dict:
+    """Load per-bucket, per-product and total revenue/cost/profit for a date range."""
+    return shop_cache.get_or_load(
+        user_id, ('aggregates', start_date, end_date, str(product_id) if product_id else None, bucket),
+        lambda: aggregate_sales(user_id, start_date, end_date, product_id, bucket,
+                                replica=replica_ok(str(user_id)))
+    )
+
+def fetch_inventory_balances(user_id: str) -> pd.DataFrame:
+    """Load on-hand quantities and low-stock flags for every product."""
+    return shop_cache.get_or_load(user_id, ('inventory',),
+                                  lambda: get_inventory(user_id, replica=replica_ok(str(user_id))))
+
+def fetch_sales_report(user_id: str, start_date: date, end_date: date, product_id: Optional[str] = None) -> pd.DataFrame:
+    """Load every sale in a date range. Not cached, as the range is unbounded."""
+    return fetch_frame(
+        SALES_REPORT_SQL,
+        (user_id, start_date, end_date, product_id, product_id),
+        replica=replica_ok(str(user_id))
+    )
+
 def get_products(user_id: str) -> pd.DataFrame:
     """Get all products for a shop."""
     try:
-        products = execute_query(
-            "SELECT id, name, buying_price, selling_price, created_at FROM products WHERE shop_id = %s ORDER BY created_at DESC",
-            (user_id,),
-            fetch=True
-        )
-        return pd.DataFrame(products)
+        return fetch_products(user_id)
     except Exception as e:
         st.error(f"Error fetching products: {e}")
         return pd.DataFrame()
 
 def add_product(user_id: str, name: str, buying_price: float, selling_price: float):
-    """Add a new product to the shop."""
+    """Add a new product to the shop, starting with an empty inventory balance."""
     execute_query(
-        "INSERT INTO products (shop_id, name, buying_price, selling_price) VALUES (%s, %s, %s, %s)",
+        """
+        WITH new_product AS (
+            INSERT INTO products (shop_id, name, buying_price, selling_price) VALUES (%s, %s, %s, %s)
+            RETURNING id, shop_id
+        )
+        INSERT INTO inventory_balances (shop_id, product_id)
+        SELECT shop_id, id FROM new_product
+        """,
         (user_id, name, buying_price, selling_price)
     )
+    shop_written(user_id)
 
 def update_stock(user_id: str, product_id: str, quantity: int, stock_date: date):
-    """Update stock for a product."""
-    execute_query(
-        "INSERT INTO stock (shop_id, product_id, quantity, date) VALUES (%s, %s, %s, %s)",
-        (user_id, product_id, quantity, stock_date)
-    )
+    """Update stock for a product and its on-hand balance."""
+    if write_journal.enabled:
+        write_journal.append('stock', user_id, stock_date, [(product_id, quantity)])
+        return
+    
+    ensure_partitions('stock', [stock_date])
+    with transaction() as cur:
+        cur.execute(
+            "INSERT INTO stock (shop_id, product_id, quantity, date) VALUES (%s, %s, %s, %s)",
+            (user_id, product_id, quantity, stock_date)
+        )
+        apply_movements(cur, [(user_id, product_id, quantity, 0)])
+    shop_written(user_id)
 
 def record_sale(user_id: str, product_id: str, quantity: int, sale_date: date):
     """Record a sale."""
-    execute_query(
-        "INSERT INTO sales (shop_id, product_id, quantity, date) VALUES (%s, %s, %s, %s)",
-        (user_id, product_id, quantity, sale_date)
+    record_sales(user_id, [(product_id, quantity)], sale_date)
+
+def record_sales(user_id: str, lines: list, sale_date: date):
+    """
+    Record several (product_id, quantity) sale lines in one round trip.
+    All lines, their daily summary updates and inventory balances commit
+    together or not at all. With the write journal enabled the lines are
+    queued locally and applied by its flusher.
+    """
+    if not lines:
+        return
+    
+    if write_journal.enabled:
+        write_journal.append('sales', user_id, sale_date, lines)
+        return
+    
+    values = [(user_id, product_id, quantity, sale_date) for product_id, quantity in lines]
+    ensure_partitions('sales', [sale_date])
+    with transaction() as cur:
+        # page_size covers every line so the batch stays a single statement
+        execute_values(cur, RECORD_SALES_SQL, values, page_size=len(values))
+        apply_movements(cur, [(user_id, product_id, 0, quantity) for product_id, quantity in lines])
+    shop_written(user_id)
+
+def load_daily_profit(user_id: str, target_date: date) -> Tuple[float, pd.DataFrame]:
+    """Load daily profit and per-product sales for a specific date from the database."""
+    # One summary row per product sold that day
+    sales_df = fetch_frame(
+        """
+        SELECT p.name,
+               d.cost / NULLIF(d.quantity, 0) AS buying_price,
+               d.revenue / NULLIF(d.quantity, 0) AS selling_price,
+               d.quantity AS sold_quantity, d.profit
+        FROM sales_daily_summary d
+        JOIN products p ON d.product_id = p.id
+        WHERE d.shop_id = %s AND d.date = %s
+        ORDER BY d.profit DESC
+        """,
+        (user_id, target_date),
+        replica=replica_ok(str(user_id))
     )
+    
+    if sales_df.empty:
+        return 0, pd.DataFrame()
+    
+    return float(sales_df['profit'].sum()), sales_df
 
 def get_daily_profit(user_id: str, target_date: date) -> Tuple[float, pd.DataFrame]:
-    """Get daily profit and sales details for a specific date."""
+    """Get daily profit and per-product sales for a specific date."""
     try:
-        # Get sales for the day with product information
-        sales_data = execute_query(
-            """
-            SELECT s.quantity, p.name, p.buying_price, p.selling_price
-            FROM sales s
-            JOIN products p ON s.product_id = p.id
-            WHERE s.shop_id = %s AND s.date = %s
-            ORDER BY s.created_at DESC
-            """,
-            (user_id, target_date),
-            fetch=True
-        )
-        
-        if not sales_data:
-            return 0, pd.DataFrame()
-        
-        # Process sales data
-        sales_list = []
-        total_profit = 0
-        
-        for sale in sales_data:
-            profit = (sale['selling_price'] - sale['buying_price']) * sale['quantity']
-            total_profit += profit
-            
-            sales_list.append({
-                'name': sale['name'],
-                'buying_price': float(sale['buying_price']),
-                'selling_price': float(sale['selling_price']),
-                'sold_quantity': sale['quantity'],
-                'profit': profit
-            })
-        
-        return total_profit, pd.DataFrame(sales_list)
-        
+        return fetch_daily_profit(user_id, target_date)
     except Exception as e:
         st.error(f"Error calculating profit: {e}")
         return 0, pd.DataFrame()
 
-def get_sales_report(user_id: str, start_date: date, end_date: date) -> pd.DataFrame:
-    """Get sales report for a date range."""
+def get_period_comparison(user_id: str, target_date: date) -> dict:
+    """Get period-over-period comparisons ending on a date."""
     try:
-        sales_data = execute_query(
-            """
-            SELECT s.date, s.quantity, p.name, p.buying_price, p.selling_price
-            FROM sales s
-            JOIN products p ON s.product_id = p.id
-            WHERE s.shop_id = %s AND s.date >= %s AND s.date <= %s
-            ORDER BY s.date DESC, s.created_at DESC
-            """,
-            (user_id, start_date, end_date),
-            fetch=True
-        )
+        return fetch_period_comparison(user_id, target_date)
+    except Exception as e:
+        st.error(f"Error comparing periods: {e}")
+        return empty_comparison()
+
+def percent_change(current: float, previous: float) -> Optional[str]:
+    """Delta label for st.metric, or None when there is nothing to compare with."""
+    if not previous:
+        return None
+    return f"{(current - previous) / abs(previous) * 100:+.1f}%"
+
+def get_sales_report(user_id: str, start_date: date, end_date: date, product_id: Optional[str] = None) -> pd.DataFrame:
+    """Get sales report for a date range, optionally for a single product."""
+    try:
+        report_df = fetch_sales_report(user_id, start_date, end_date, product_id)
         
-        if not sales_data:
+        if report_df.empty:
             return pd.DataFrame()
         
-        processed_data = []
-        for sale in sales_data:
-            profit = (float(sale['selling_price']) - float(sale['buying_price'])) * sale['quantity']
-            processed_data.append({
-                'date': sale['date'],
-                'name': sale['name'],
-                'buying_price': float(sale['buying_price']),
-                'selling_price': float(sale['selling_price']),
-                'quantity': sale['quantity'],
-                'profit': profit
-            })
-        
-        return pd.DataFrame(processed_data)
+        return report_df
         
     except Exception as e:
         st.error(f"Error generating report: {e}")
         return pd.DataFrame()
 
+def get_sales_page(user_id: str, start_date: date, end_date: date, product_id: Optional[str] = None,
+                   sort: str = 'date', descending: bool = True,
+                   after: Optional[tuple] = None) -> Tuple[pd.DataFrame, Optional[tuple]]:
+    """Get one page of the sales report and the cursor for the next page."""
+    try:
+        return fetch_sales_page(user_id, start_date, end_date, product_id, sort, descending, after)
+    except Exception as e:
+        st.error(f"Error fetching sales page: {e}")
+        return pd.DataFrame(columns=DETAIL_COLUMNS), None
+
+def discard_sales_export():
+    """Close the prepared sales report export, if there is one."""
+    export = st.session_state.pop('report_export', None)
+    if export:
+        export['file'].close()
+
+def prepare_sales_export(user_id: str, start_date: date, end_date: date, product_id: Optional[str],
+                         fmt: str, replica: bool, request: tuple) -> Optional[dict]:
+    """
+    Build a sales report export and keep its spooled file in session state
+    until the report changes. download_button needs the file as bytes, so
+    exports above DOWNLOAD_MAX_BYTES are left to export.py.
+    """
+    discard_sales_export()
+    try:
+        export_file = spooled_sales_export(user_id, start_date, end_date, product_id, fmt=fmt, replica=replica)
+    except Exception as e:
+        st.error(f"Error preparing export: {e}")
+        return None
+    
+    size = export_file.seek(0, io.SEEK_END)
+    if size > DOWNLOAD_MAX_BYTES:
+        export_file.close()
+        st.warning(f"This export is {size / 1024 / 1024:,.1f} MB, over the "
+                   f"{DOWNLOAD_MAX_BYTES / 1024 / 1024:,.1f} MB download limit. "
+                   "Narrow the date range or run export.py instead.")
+        return None
+    
+    export = {'request': request, 'file': export_file}
+    st.session_state['report_export'] = export
+    return export
+
+def get_report_aggregates(user_id: str, start_date: date, end_date: date, product_id: Optional[str] = None,
+                          bucket: Optional[str] = None) -> dict:
+    """Get per-bucket, per-product and total revenue/cost/profit for a date range."""
+    try:
+        return fetch_report_aggregates(user_id, start_date, end_date, product_id, bucket)
+    except Exception as e:
+        st.error(f"Error aggregating report: {e}")
+        return empty_aggregates()
+
+def get_inventory_balances(user_id: str) -> pd.DataFrame:
+    """Get on-hand quantities and low-stock flags for every product."""
+    try:
+        return fetch_inventory_balances(user_id)
+    except Exception as e:
+        st.error(f"Error fetching inventory: {e}")
+        return pd.DataFrame()
+
+def report_cursor() -> Optional[tuple]:
+    """Cursor of the visible report detail page; a changed sort starts again from page one."""
+    sort_state = (st.session_state.get('report_sort', "Date"), st.session_state.get('report_order', "Descending"))
+    if st.session_state.get('report_sort_state') != sort_state:
+        st.session_state['report_sort_state'] = sort_state
+        st.session_state['report_pages'] = [None]
+    return st.session_state['report_pages'][-1]
+
+def prefetch_page(menu: str, user_id: str):
+    """
+    Run the independent queries a page is about to make at the same time,
+    each on its own pooled connection, so rendering waits only for the
+    slowest one. Results land in the shop cache, where the page's own get_*
+    calls pick them up; failures are left for those calls to report.
+    """
+    # Widget values are already in session state at the start of a rerun
+    loaders = {}
+    if not st.session_state.get('user_data'):
+        loaders['user'] = lambda: fetch_user(user_id)
+    
+    if menu == "Dashboard":
+        selected_date = st.session_state.get('dashboard_date', date.today())
+        loaders['daily_profit'] = lambda: fetch_daily_profit(user_id, selected_date)
+        loaders['comparison'] = lambda: fetch_period_comparison(user_id, selected_date)
+    
+    elif menu == "Inventory":
+        loaders['inventory'] = lambda: fetch_inventory_balances(user_id)
+    
+    elif menu == "View Reports":
+        loaders['products'] = lambda: fetch_products(user_id)
+        report_request = st.session_state.get('report_request')
+        if report_request:
+            start_date = report_request['start_date']
+            end_date = report_request['end_date']
+            product_id = report_request['product_id']
+            bucket = TREND_BUCKET_OPTIONS[st.session_state.get('report_bucket', "Auto")]
+            sort = DETAIL_SORT_OPTIONS[st.session_state.get('report_sort', "Date")]
+            descending = st.session_state.get('report_order', "Descending") == "Descending"
+            after = report_cursor()
+            loaders['aggregates'] = lambda: fetch_report_aggregates(user_id, start_date, end_date, product_id, bucket)
+            loaders['sales_page'] = lambda: fetch_sales_page(
+                user_id, start_date, end_date, product_id, sort, descending, after
+            )
+    
+    if len(loaders) > 1:
+        run_concurrently(loaders, return_exceptions=True)
+
+def update_low_stock_threshold(user_id: str, product_id: str, threshold: Optional[int]):
+    """Set a product's low-stock threshold (None uses the shop default)."""
+    if not set_low_stock_threshold(user_id, product_id, threshold):
+        raise ValueError("This product has no inventory balance; refresh the page and try again")
+    shop_written(user_id)
+
 
 
 # Authentication UI
@@ -374,9 +621,7 @@ def show_auth():
                         if error:
                             st.error(f"Sign in failed: {error}")
                         elif response:
-                            st.session_state['authenticated'] = True
-                            st.session_state['user_id'] = response['id']
-                            st.session_state['user_data'] = response
+                            start_session(response)
                             st.success("Successfully signed in!")
                             st.rerun()
                         else:
@@ -418,9 +663,7 @@ def show_auth():
                             if error:
                                 st.error(error)
                             elif response:
-                                st.session_state['authenticated'] = True
-                                st.session_state['user_id'] = response['id']
-                                st.session_state['user_data'] = response
+                                start_session(response)
                                 st.success("Account created successfully!")
                                 st.rerun()
 
@@ -430,26 +673,66 @@ def show_app():
     
     # Sidebar navigation
     st.sidebar.title("Navigation")
-    menu = st.sidebar.radio("Go to", ["Dashboard", "Add Products", "Update Stock", "Record Sales", "View Reports"])
+    menu = st.sidebar.radio("Go to", ["Dashboard", "Add Products", "Update Stock", "Inventory", "Record Sales", "Bulk Import", "View Reports"])
     
-    # User info and logout
-    st.sidebar.markdown("---")
+    # Page time covers the queries too; they all start together, before
+    # anything (the sidebar included) waits on one of them
+    with metrics.page_timer(menu):
+        prefetch_page(menu, user_id)
+        
+        # User info and logout
+        st.sidebar.markdown("---")
+        try:
+            user = get_current_user()
+            shop_name = user['shop_name'] if user and user['shop_name'] else "Your Shop"
+            st.sidebar.write(f"Logged in as: **{shop_name}**")
+        except Exception:
+            st.sidebar.write("Logged in")
+        
+        # Filled after the page so writes it just queued are counted
+        journal_status = st.sidebar.container()
+        
+        if st.sidebar.button("Sign Out"):
+            sign_out()
+        
+        render_page(menu, user_id)
+        show_journal_status(journal_status, user_id)
+
+def show_journal_status(container, user_id: str):
+    """Show the shop's journaled writes that have not reached the database yet."""
     try:
-        user = get_current_user()
-        shop_name = user['shop_name'] if user and user['shop_name'] else "Your Shop"
-        st.sidebar.write(f"Logged in as: **{shop_name}**")
-    except Exception:
-        st.sidebar.write("Logged in")
-    
-    if st.sidebar.button("Sign Out"):
-        sign_out()
+        pending = write_journal.pending_count(user_id)
+        failed = write_journal.failed_entries(user_id) if write_journal.enabled else []
+    except Exception as e:
+        container.warning(f"Could not read the write journal: {e}")
+        return
     
+    if pending:
+        container.info(f"⏳ {pending} write(s) waiting to sync")
+    if failed:
+        container.error(f"{len(failed)} write(s) could not be saved: {failed[-1]['error']}")
+        if container.button("Retry Failed Writes"):
+            write_journal.retry_failed(user_id)
+            st.rerun()
+
+# View Reports detail table sort choices
+DETAIL_SORT_OPTIONS = {"Date": 'date', "Quantity": 'quantity', "Profit": 'profit'}
+
+# View Reports trend bucket choices (None lets the range length decide)
+TREND_BUCKET_OPTIONS = {"Auto": None, "Day": 'day', "Week": 'week', "Month": 'month'}
+BUCKET_TITLES = {'day': 'Daily', 'week': 'Weekly', 'month': 'Monthly'}
+
+# View Reports sales export formats
+EXPORT_FORMAT_LABELS = {'csv': "CSV", 'parquet': "Parquet", 'arrow': "Arrow IPC"}
+
+def render_page(menu: str, user_id: str):
+    """Render the page selected in the sidebar."""
     # Dashboard
     if menu == "Dashboard":
         st.header("Dashboard")
         
         # Date selector
-        selected_date = st.date_input("Select date", value=date.today())
+        selected_date = st.date_input("Select date", value=date.today(), key='dashboard_date')
         
         # Display daily profit
         profit, sales_details = get_daily_profit(user_id, selected_date)
@@ -465,6 +748,29 @@ def show_app():
         with col3:
             st.metric("Daily Profit", f"KSh {profit:,.2f}")
         
+        # Period-over-period profit, all from one query
+        comparison = get_period_comparison(user_id, selected_date)
+        periods = comparison['periods']
+        for col, (period, label) in zip(st.columns(len(COMPARISON_PERIODS)), COMPARISON_PERIODS):
+            with col:
+                current = periods.at[period, 'profit']
+                previous = periods.at[period, 'previous_profit']
+                st.metric(label, f"KSh {current:,.2f}", delta=percent_change(current, previous),
+                          help=f"Previous period: KSh {previous:,.2f}")
+        
+        if not comparison['products'].empty:
+            with st.expander("Product Changes"):
+                period_labels = dict(COMPARISON_PERIODS)
+                selected_period = st.selectbox("Compare", list(period_labels),
+                                               format_func=period_labels.get, key='dashboard_compare')
+                product_changes = comparison['products']
+                product_changes = product_changes[product_changes['period'] == selected_period]
+                display_changes = product_changes[['name', 'profit', 'previous_profit', 'profit_change',
+                                                   'quantity', 'previous_quantity']].copy()
+                display_changes.columns = ['Product', 'Profit (KSh)', 'Previous Profit (KSh)', 'Change (KSh)',
+                                           'Quantity', 'Previous Quantity']
+                st.dataframe(display_changes, use_container_width=True, hide_index=True)
+        
         # Display sales details
         if not sales_details.empty:
             st.subheader("Sales Details")
@@ -557,42 +863,181 @@ def show_app():
         else:
             st.info("Please add products first before updating stock.")
 
-    # Record Sales
-    elif menu == "Record Sales":
-        st.header("Record Sales")
+    # Inventory
+    elif menu == "Inventory":
+        st.header("Inventory")
         
-        products_df = get_products(user_id)
+        inventory_df = get_inventory_balances(user_id)
         
-        if not products_df.empty:
-            with st.form("sales_form"):
-                col1, col2, col3 = st.columns(3)
+        if not inventory_df.empty:
+            low_stock_df = inventory_df[inventory_df['low_stock']]
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Products", len(inventory_df))
+            with col2:
+                st.metric("Units On Hand", f"{int(inventory_df['on_hand'].sum()):,}")
+            with col3:
+                st.metric("Low Stock", len(low_stock_df))
+            
+            if not low_stock_df.empty:
+                st.warning("Low stock: " + ", ".join(
+                    f"{row.name} ({row.on_hand})" for row in low_stock_df.itertuples()
+                ))
+            
+            display_inventory = inventory_df[['name', 'stock_in', 'sold', 'on_hand', 'low_stock_threshold']].copy()
+            display_inventory.columns = ['Product', 'Stock In', 'Sold', 'On Hand', 'Low Stock At']
+            st.dataframe(display_inventory, use_container_width=True)
+            
+            # Per-product low-stock thresholds
+            st.subheader("Low Stock Threshold")
+            with st.form("threshold_form"):
+                col1, col2 = st.columns(2)
                 
                 with col1:
-                    product_names = products_df['name'].tolist()
-                    selected_product = st.selectbox("Select Product", product_names)
-                    product_id_map = dict(zip(products_df['name'], products_df['id']))
-                    product_id = product_id_map.get(selected_product)
-                    if product_id is None:
-                        st.error("Product not found")
-                        st.stop()
+                    selected_product = st.selectbox("Select Product", inventory_df['name'].tolist())
+                    product_id = dict(zip(inventory_df['name'], inventory_df['product_id']))[selected_product]
                 
                 with col2:
-                    quantity = st.number_input("Quantity Sold", min_value=1, step=1)
-                
-                with col3:
-                    sale_date = st.date_input("Sale Date", value=date.today())
+                    threshold = st.number_input("Warn at or below", min_value=0, step=1, value=LOW_STOCK_THRESHOLD)
                 
-                submitted = st.form_submit_button("Record Sale")
+                use_default = st.checkbox(f"Use the default ({LOW_STOCK_THRESHOLD})")
+                submitted = st.form_submit_button("Save Threshold")
                 
                 if submitted:
                     try:
-                        record_sale(user_id, product_id, quantity, sale_date)
-                        st.success(f"Sale recorded for '{selected_product}'!")
+                        update_low_stock_threshold(user_id, product_id, None if use_default else int(threshold))
+                        st.success(f"Threshold saved for '{selected_product}'!")
+                        st.rerun()
                     except Exception as e:
-                        st.error(f"Error recording sale: {e}")
+                        st.error(f"Error saving threshold: {e}")
+        else:
+            st.info("Please add products first to track inventory.")
+
+    # Record Sales
+    elif menu == "Record Sales":
+        st.header("Record Sales")
+        
+        products_df = get_products(user_id)
+        
+        if not products_df.empty:
+            product_names = products_df['name'].tolist()
+            product_id_map = dict(zip(products_df['name'], products_df['id']))
+            sale_mode = st.radio("Mode", ["Single Sale", "Basket"], horizontal=True)
+            
+            if sale_mode == "Single Sale":
+                with st.form("sales_form"):
+                    col1, col2, col3 = st.columns(3)
+                    
+                    with col1:
+                        selected_product = st.selectbox("Select Product", product_names)
+                        product_id = product_id_map.get(selected_product)
+                        if product_id is None:
+                            st.error("Product not found")
+                            st.stop()
+                    
+                    with col2:
+                        quantity = st.number_input("Quantity Sold", min_value=1, step=1)
+                    
+                    with col3:
+                        sale_date = st.date_input("Sale Date", value=date.today())
+                    
+                    submitted = st.form_submit_button("Record Sale")
+                    
+                    if submitted:
+                        try:
+                            record_sale(user_id, product_id, quantity, sale_date)
+                            st.success(f"Sale recorded for '{selected_product}'!")
+                        except Exception as e:
+                            st.error(f"Error recording sale: {e}")
+            else:
+                # Basket lines live in session state until checkout, so adding
+                # lines never touches the database
+                basket = st.session_state['basket']
+                
+                with st.form("basket_form", clear_on_submit=True):
+                    col1, col2 = st.columns(2)
+                    
+                    with col1:
+                        selected_product = st.selectbox("Select Product", product_names)
+                    
+                    with col2:
+                        quantity = st.number_input("Quantity", min_value=1, step=1)
+                    
+                    if st.form_submit_button("Add to Basket"):
+                        product_id = product_id_map.get(selected_product)
+                        if product_id is None:
+                            st.error("Product not found")
+                        else:
+                            line = basket.setdefault(str(product_id), {'name': selected_product, 'quantity': 0})
+                            line['quantity'] += int(quantity)
+                
+                if basket:
+                    st.subheader("Basket")
+                    basket_df = pd.DataFrame(
+                        [(line['name'], line['quantity']) for line in basket.values()],
+                        columns=['Product', 'Quantity']
+                    )
+                    st.dataframe(basket_df, use_container_width=True)
+                    
+                    col1, col2, col3 = st.columns(3)
+                    
+                    with col1:
+                        sale_date = st.date_input("Sale Date", value=date.today())
+                    
+                    with col2:
+                        if st.button("Checkout", type="primary"):
+                            try:
+                                lines = [(product_id, line['quantity']) for product_id, line in basket.items()]
+                                record_sales(user_id, lines, sale_date)
+                                st.session_state['basket'] = {}
+                                st.success(f"Recorded {len(lines)} sale line(s)!")
+                            except Exception as e:
+                                st.error(f"Error recording sales: {e}")
+                    
+                    with col3:
+                        if st.button("Clear Basket"):
+                            st.session_state['basket'] = {}
+                            st.rerun()
+                else:
+                    st.info("Basket is empty. Add products above.")
         else:
             st.info("Please add products first before recording sales.")
 
+    # Bulk Import
+    elif menu == "Bulk Import":
+        st.header("Bulk Import")
+        st.markdown("Upload a CSV with **product**, **quantity** and **date** (YYYY-MM-DD) columns. "
+                    "The whole file is validated first and nothing is imported if any row is invalid.")
+        
+        import_kind = st.radio("Data type", ["sales", "stock"], format_func=str.title, horizontal=True)
+        uploaded_file = st.file_uploader("CSV file", type=["csv"])
+        
+        if uploaded_file is not None and st.button("Validate and Import", type="primary"):
+            try:
+                with st.spinner("Validating file..."):
+                    product_map = load_product_map(user_id)
+                    rows, errors = parse_import_csv(
+                        io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline=''),
+                        import_kind,
+                        product_map
+                    )
+                
+                if errors:
+                    st.error(f"{len(errors)} invalid row(s); nothing was imported.")
+                    error_df = pd.DataFrame(errors)
+                    error_df.columns = ['Row', 'Error']
+                    st.dataframe(error_df, use_container_width=True)
+                elif not rows:
+                    st.info("The file has no data rows.")
+                else:
+                    with st.spinner(f"Importing {len(rows)} rows..."):
+                        inserted = import_rows(user_id, import_kind, rows)
+                        shop_written(user_id)
+                    st.success(f"Imported {inserted} {import_kind} row(s)!")
+            except Exception as e:
+                st.error(f"Error importing data: {e}")
+
     # View Reports
     elif menu == "View Reports":
         st.header("Advanced Sales Reports")
@@ -641,59 +1086,99 @@ def show_app():
         
         if st.button("Generate Advanced Report", type="primary"):
             if start_date <= end_date:
-                report_df = get_sales_report(user_id, start_date, end_date)
+                # Resolve the product filter to an id so filtering happens in SQL
+                product_id = None
+                if selected_product_filter != "All Products":
+                    product_id_map = dict(zip(products_df['name'], products_df['id']))
+                    product_id = product_id_map.get(selected_product_filter)
                 
-                # Apply product filter
-                if selected_product_filter != "All Products" and not report_df.empty:
-                    report_df = report_df[report_df['name'] == selected_product_filter]
+                # Kept in session state so paging through the report survives reruns
+                st.session_state['report_request'] = {
+                    'start_date': start_date,
+                    'end_date': end_date,
+                    'product_id': product_id,
+                    'product_filter': selected_product_filter,
+                }
+                st.session_state['report_pages'] = [None]
+            else:
+                st.session_state.pop('report_request', None)
+                st.error("End date must be after start date!")
+        
+        report_request = st.session_state.get('report_request')
+        if report_request:
+            start_date = report_request['start_date']
+            end_date = report_request['end_date']
+            product_id = report_request['product_id']
+            selected_product_filter = report_request['product_filter']
+            
+            # Auto picks day, week or month buckets from the range length
+            trend_by = st.selectbox("Trend by", list(TREND_BUCKET_OPTIONS), key='report_bucket')
+            aggregates = get_report_aggregates(user_id, start_date, end_date, product_id, TREND_BUCKET_OPTIONS[trend_by])
+            totals = aggregates['totals']
+            
+            if totals['sales_count'] > 0:
+                st.subheader(f"Sales Report: {start_date} to {end_date}")
+                if selected_product_filter != "All Products":
+                    st.caption(f"Filtered by: {selected_product_filter}")
                 
-                if not report_df.empty:
-                    st.subheader(f"Sales Report: {start_date} to {end_date}")
-                    if selected_product_filter != "All Products":
-                        st.caption(f"Filtered by: {selected_product_filter}")
-                    
-                    # Enhanced summary metrics
-                    total_sales = len(report_df)
-                    total_profit = report_df['profit'].sum()
-                    total_revenue = (report_df['selling_price'] * report_df['quantity']).sum()
-                    total_cost = (report_df['buying_price'] * report_df['quantity']).sum()
-                    avg_profit_per_sale = total_profit / total_sales if total_sales > 0 else 0
-                    profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
-                    
-                    # Display metrics in cards
-                    col1, col2, col3 = st.columns(3)
-                    
-                    with col1:
-                        st.metric("Total Sales", total_sales)
-                        st.metric("Total Revenue", f"KSh {total_revenue:,.2f}")
-                    
-                    with col2:
-                        st.metric("Total Profit", f"KSh {total_profit:,.2f}")
-                        st.metric("Total Cost", f"KSh {total_cost:,.2f}")
-                    
-                    with col3:
-                        st.metric("Avg Profit/Sale", f"KSh {avg_profit_per_sale:,.2f}")
-                        st.metric("Profit Margin", f"{profit_margin:.1f}%")
-                    
-                    st.markdown("---")
+                # Enhanced summary metrics
+                total_sales = totals['sales_count']
+                total_profit = totals['profit']
+                total_revenue = totals['revenue']
+                total_cost = totals['cost']
+                avg_profit_per_sale = total_profit / total_sales if total_sales > 0 else 0
+                profit_margin = (total_profit / total_revenue * 100) if total_revenue > 0 else 0
+                
+                # Display metrics in cards
+                col1, col2, col3 = st.columns(3)
+                
+                with col1:
+                    st.metric("Total Sales", total_sales)
+                    st.metric("Total Revenue", f"KSh {total_revenue:,.2f}")
+                
+                with col2:
+                    st.metric("Total Profit", f"KSh {total_profit:,.2f}")
+                    st.metric("Total Cost", f"KSh {total_cost:,.2f}")
+                
+                with col3:
+                    st.metric("Avg Profit/Sale", f"KSh {avg_profit_per_sale:,.2f}")
+                    st.metric("Profit Margin", f"{profit_margin:.1f}%")
+                
+                st.markdown("---")
+                
+                # Export functionality
+                st.subheader("Export Data")
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    # Sales export streamed from PostgreSQL, spooled to disk when large.
+                    # Built only on Prepare Export, so paging the detail table stays cheap.
+                    export_format = st.selectbox("Format", list(EXPORT_FORMATS), key='report_export_format',
+                                                 format_func=EXPORT_FORMAT_LABELS.get)
+                    extension, mime = EXPORT_FORMATS[export_format]
+                    export_request = (str(user_id), start_date, end_date, product_id, export_format)
+                    export = st.session_state.get('report_export')
+                    if export and export['request'] != export_request:
+                        discard_sales_export()
+                        export = None
                     
-                    # Export functionality
-                    st.subheader("Export Data")
-                    col1, col2 = st.columns(2)
+                    if export is None and st.button("Prepare Export"):
+                        export = prepare_sales_export(user_id, start_date, end_date, product_id, export_format,
+                                                      replica_ok(str(user_id)), export_request)
                     
-                    with col1:
-                        # CSV export
-                        csv_data = report_df.to_csv(index=False)
+                    if export:
+                        export['file'].seek(0)
                         st.download_button(
-                            label="📥 Download CSV",
-                            data=csv_data,
-                            file_name=f"sales_report_{start_date}_{end_date}.csv",
-                            mime="text/csv"
+                            label=f"📥 Download {EXPORT_FORMAT_LABELS[export_format]}",
+                            data=export['file'].read(),
+                            file_name=f"sales_report_{start_date}_{end_date}.{extension}",
+                            mime=mime,
+                            on_click="ignore"
                         )
-                    
-                    with col2:
-                        # Summary export
-                        summary_data = f"""Sales Report Summary
+                
+                with col2:
+                    # Summary export
+                    summary_data = f"""Sales Report Summary
 Period: {start_date} to {end_date}
 Product Filter: {selected_product_filter}
 
@@ -707,82 +1192,93 @@ Key Metrics:
 
 Generated on: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
 """
-                        st.download_button(
-                            label="📋 Download Summary",
-                            data=summary_data,
-                            file_name=f"sales_summary_{start_date}_{end_date}.txt",
-                            mime="text/plain"
-                        )
+                    st.download_button(
+                        label="📋 Download Summary",
+                        data=summary_data,
+                        file_name=f"sales_summary_{start_date}_{end_date}.txt",
+                        mime="text/plain"
+                    )
+                
+                # Enhanced visualizations
+                st.subheader("Analytics Charts")
+                
+                # Bucketed and per-product aggregates come straight from SQL;
+                # trend lines are downsampled so Plotly never gets too many points
+                daily_analysis = aggregates['daily']
+                product_performance = aggregates['products']
+                period = BUCKET_TITLES[aggregates['bucket']]
+                
+                if not daily_analysis.empty:
+                    tab1, tab2, tab3 = st.tabs(["Profit Trend", "Product Performance", "Revenue vs Cost"])
                     
-                    # Enhanced visualizations
-                    st.subheader("Analytics Charts")
+                    with tab1:
+                        fig = px.line(downsample(daily_analysis, 'date', 'profit'), x='date', y='profit',
+                                      title=f'{period} Profit Trend', markers=True)
+                        fig.update_layout(xaxis_title='Date', yaxis_title='Profit (KSh)')
+                        st.plotly_chart(fig, use_container_width=True)
                     
-                    # Daily profit trend
-                    if len(report_df) > 0:
-                        daily_profit = report_df.groupby('date')['profit'].sum().reset_index()
-                        daily_revenue = report_df.groupby('date').apply(lambda x: (x['selling_price'] * x['quantity']).sum()).reset_index()
-                        daily_revenue.columns = ['date', 'revenue']
-                        
-                        tab1, tab2, tab3 = st.tabs(["Profit Trend", "Product Performance", "Revenue vs Cost"])
-                        
-                        with tab1:
-                            fig = px.line(daily_profit, x='date', y='profit', title='Daily Profit Trend', markers=True)
-                            fig.update_layout(xaxis_title='Date', yaxis_title='Profit (KSh)')
-                            st.plotly_chart(fig, use_container_width=True)
+                    with tab2:
+                        # Product performance
+                        fig2 = px.bar(product_performance, x='name', y='profit', title='Profit by Product')
+                        fig2.update_layout(xaxis_title='Product', yaxis_title='Total Profit (KSh)')
+                        st.plotly_chart(fig2, use_container_width=True)
                         
-                        with tab2:
-                            # Product performance
-                            product_performance = report_df.groupby('name').agg({
-                                'profit': 'sum',
-                                'quantity': 'sum'
-                            }).reset_index().sort_values('profit', ascending=False)
-                            
-                            fig2 = px.bar(product_performance, x='name', y='profit', title='Profit by Product')
-                            fig2.update_layout(xaxis_title='Product', yaxis_title='Total Profit (KSh)')
-                            st.plotly_chart(fig2, use_container_width=True)
-                            
-                            # Top products table
-                            st.subheader("Top Performing Products")
-                            top_products = product_performance.head(10).copy()
-                            top_products.columns = ['Product', 'Total Profit (KSh)', 'Total Quantity Sold']
-                            st.dataframe(top_products, use_container_width=True)
-                        
-                        with tab3:
-                            # Revenue vs Cost analysis
-                            daily_analysis = report_df.groupby('date').agg({
-                                'profit': 'sum'
-                            }).reset_index()
-                            
-                            # Calculate revenue and cost separately
-                            daily_revenue = report_df.groupby('date').apply(
-                                lambda x: (x['selling_price'] * x['quantity']).sum()
-                            ).to_frame('revenue').reset_index()
-                            
-                            daily_cost = report_df.groupby('date').apply(
-                                lambda x: (x['buying_price'] * x['quantity']).sum()
-                            ).to_frame('cost').reset_index()
-                            
-                            # Merge all metrics
-                            daily_analysis = daily_analysis.merge(daily_revenue, on='date').merge(daily_cost, on='date')
-                            
-                            fig3 = px.line(daily_analysis, x='date', y=['revenue', 'cost'], title='Daily Revenue vs Cost')
-                            fig3.update_layout(xaxis_title='Date', yaxis_title='Amount (KSh)')
-                            st.plotly_chart(fig3, use_container_width=True)
+                        # Top products table
+                        st.subheader("Top Performing Products")
+                        top_products = product_performance[['name', 'profit', 'quantity']].head(10).copy()
+                        top_products.columns = ['Product', 'Total Profit (KSh)', 'Total Quantity Sold']
+                        st.dataframe(top_products, use_container_width=True)
                     
-                    # Detailed report table
-                    st.subheader("Detailed Sales Data")
-                    display_columns = ['date', 'name', 'buying_price', 'selling_price', 'quantity', 'profit']
-                    if len(report_df) > 0:
-                        display_report = pd.DataFrame(report_df[display_columns])
-                        display_report.columns = ['Date', 'Product', 'Buying Price (KSh)', 'Selling Price (KSh)', 'Quantity', 'Profit (KSh)']
-                        st.dataframe(display_report, use_container_width=True)
-                    else:
-                        st.info("No detailed sales data to display.")
+                    with tab3:
+                        # Revenue vs Cost analysis
+                        fig3 = px.line(downsample_series(daily_analysis, 'date', ['revenue', 'cost']),
+                                       x='date', y='value', color='series', title=f'{period} Revenue vs Cost')
+                        fig3.update_layout(xaxis_title='Date', yaxis_title='Amount (KSh)')
+                        st.plotly_chart(fig3, use_container_width=True)
+                
+                # Detailed report table, fetched one page at a time from PostgreSQL
+                st.subheader("Detailed Sales Data")
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    sort_label = st.selectbox("Sort by", list(DETAIL_SORT_OPTIONS), key='report_sort')
+                
+                with col2:
+                    sort_order = st.radio("Order", ["Descending", "Ascending"], horizontal=True, key='report_order')
+                
+                # A new sort starts again from the first page
+                after = report_cursor()
+                pages = st.session_state['report_pages']
+                page_df, next_cursor = get_sales_page(
+                    user_id, start_date, end_date, product_id,
+                    DETAIL_SORT_OPTIONS[sort_label], sort_order == "Descending", after
+                )
+                
+                if len(page_df) > 0:
+                    display_report = pd.DataFrame(page_df[DETAIL_COLUMNS])
+                    display_report.columns = ['Date', 'Product', 'Buying Price (KSh)', 'Selling Price (KSh)', 'Quantity', 'Profit (KSh)']
+                    st.dataframe(display_report, use_container_width=True, hide_index=True)
+                    
+                    col1, col2, col3 = st.columns([1, 2, 1])
                     
+                    with col1:
+                        if st.button("◀ Previous", disabled=len(pages) == 1):
+                            pages.pop()
+                            st.rerun()
+                    
+                    with col2:
+                        page_count = max(1, -(-total_sales // REPORT_PAGE_SIZE))
+                        st.caption(f"Page {len(pages)} of {page_count} ({total_sales:,} sales)")
+                    
+                    with col3:
+                        if st.button("Next ▶", disabled=next_cursor is None):
+                            pages.append(next_cursor)
+                            st.rerun()
                 else:
-                    st.info("No sales data found for the selected criteria.")
+                    st.info("No detailed sales data to display.")
+                
             else:
-                st.error("End date must be after start date!")
+                st.info("No sales data found for the selected criteria.")
 
 # Check for existing session
 def check_session():
@@ -799,6 +1295,7 @@ def check_session():
 
 # Main app logic
 def main():
+    flush_session_cookie()
     if not check_session():
         show_auth()
     else:
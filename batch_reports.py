@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Batch report generator for Pima app with NeonDB PostgreSQL
+Run this script to build the View Reports metrics (totals, trend and
+product breakdown) for every shop, or selected shops, over a date range
+without signing in to each one.
+
+Shops are spread across a process pool. Workers build and write their
+shop's files in parallel, but at most --max-connections of them query the
+database at any moment. Output layout (.csv, .parquet or .arrow per --format):
+
+    <out>/shops.csv            one totals row per shop
+    <out>/products.csv         every shop's product breakdown
+    <out>/summary.json         run settings, grand totals and failures
+    <out>/shops/<shop>/        summary.json, trend.csv, products.csv
+                               (and sales.csv with --with-sales)
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+import pandas as pd
+import pyarrow as pa
+from dotenv import load_dotenv
+from db import execute_query
+from export import (EXPORT_FORMATS, PRODUCTS_SCHEMA, TOTAL_FIELDS, TREND_SCHEMA, parse_date, write_frame,
+                    write_sales_export)
+from partitions import add_months, parse_month
+from reports import aggregate_sales
+
+# Load environment variables
+load_dotenv()
+
+TOTAL_COLUMNS = ['sales_count', 'quantity', 'revenue', 'cost', 'profit']
+
+# Consolidated file columns: one totals row per shop, and every shop's products
+SHOPS_SCHEMA = pa.schema(
+    [('shop_id', pa.string()), ('email', pa.string()), ('shop_name', pa.string())] + TOTAL_FIELDS +
+    [('avg_profit_per_sale', pa.float64()), ('profit_margin', pa.float64())]
+)
+SHOP_PRODUCTS_SCHEMA = pa.schema([('shop_id', pa.string()), ('shop_name', pa.string())] + list(PRODUCTS_SCHEMA))
+
+# Set in each worker by _init_worker: limits workers holding a database connection
+_db_slots = None
+
+def _init_worker(db_slots):
+    """Worker process setup: one pooled connection each, shared connection slots."""
+    global _db_slots
+    _db_slots = db_slots
+    # The pool is created on first use, after this; a worker runs one query at a time
+    os.environ["DB_POOL_MIN"] = "0"
+    os.environ["DB_POOL_MAX"] = "1"
+
+def shop_dirname(shop: dict) -> str:
+    """Filesystem-safe directory name for a shop: its name plus a short id suffix."""
+    name = re.sub(r"[^A-Za-z0-9]+", "-", shop['shop_name'] or shop['email']).strip("-").lower()
+    return f"{name or 'shop'}-{shop['shop_id'][:8]}"
+
+def report_metrics(totals: dict) -> dict:
+    """Totals plus the derived figures View Reports shows."""
+    sales_count = totals['sales_count']
+    return {
+        **totals,
+        'avg_profit_per_sale': round(totals['profit'] / sales_count, 2) if sales_count > 0 else 0,
+        'profit_margin': round(totals['profit'] / totals['revenue'] * 100, 2) if totals['revenue'] > 0 else 0,
+    }
+
+def build_shop_report(shop: dict, start_date: date, end_date: date, bucket: Optional[str],
+                      out_dir: str, with_sales: bool, fmt: str = 'csv') -> dict:
+    """
+    Aggregate one shop and write its files. Runs in a worker process.
+    Returns the shop's totals row and product rows for the consolidated files.
+    """
+    extension = EXPORT_FORMATS[fmt][0]
+    shop_dir = os.path.join(out_dir, 'shops', shop_dirname(shop))
+    os.makedirs(shop_dir, exist_ok=True)
+    
+    with _db_slots:
+        aggregates = aggregate_sales(shop['shop_id'], start_date, end_date, bucket=bucket)
+        if with_sales:
+            with open(os.path.join(shop_dir, f'sales.{extension}'), 'wb') as out:
+                write_sales_export(shop['shop_id'], start_date, end_date, out, fmt)
+    
+    # Files are written after the connection slot is released
+    metrics = report_metrics(aggregates['totals'])
+    write_frame(aggregates['daily'], os.path.join(shop_dir, f'trend.{extension}'), TREND_SCHEMA, fmt)
+    write_frame(aggregates['products'], os.path.join(shop_dir, f'products.{extension}'), PRODUCTS_SCHEMA, fmt)
+    with open(os.path.join(shop_dir, 'summary.json'), 'w') as f:
+        json.dump({
+            **shop,
+            'start_date': start_date.isoformat(),
+            'end_date': end_date.isoformat(),
+            'bucket': aggregates['bucket'],
+            **metrics,
+        }, f, indent=2)
+    
+    products = aggregates['products'].assign(shop_id=shop['shop_id'], shop_name=shop['shop_name'])
+    return {
+        'shop': {**shop, **metrics},
+        'products': products.to_dict('records'),
+    }
+
+def load_shops(selected: List[str]) -> List[dict]:
+    """Every shop, or those whose id or email is in selected."""
+    rows = execute_query(
+        """
+        SELECT u.id::text AS shop_id, u.email, s.shop_name
+        FROM users u
+        LEFT JOIN shops s ON s.id = u.id
+        WHERE cardinality(%s::text[]) = 0 OR u.id::text = ANY(%s::text[]) OR u.email = ANY(%s::text[])
+        ORDER BY s.shop_name, u.email
+        """,
+        (selected, selected, selected),
+        fetch=True
+    )
+    return [dict(row) for row in rows]
+
+def generate_reports(start_date: date, end_date: date, out_dir: str, shops: List[str], bucket: Optional[str],
+                     workers: int, max_connections: int, with_sales: bool, fmt: str = 'csv') -> bool:
+    """Build every shop's report across a process pool and write the consolidated files."""
+    if not os.getenv("DATABASE_URL"):
+        print("ERROR: DATABASE_URL environment variable is not set!")
+        return False
+    
+    try:
+        print("Connecting to NeonDB PostgreSQL...")
+        shop_rows = load_shops(shops)
+        missing = set(shops) - {shop['shop_id'] for shop in shop_rows} - {shop['email'] for shop in shop_rows}
+        if missing:
+            print(f"ERROR: Unknown shop(s): {', '.join(sorted(missing))}")
+            return False
+        if not shop_rows:
+            print("ERROR: No shops to report on.")
+            return False
+        
+        print(f"Building reports for {len(shop_rows)} shop(s) from {start_date} to {end_date} "
+              f"({workers} workers, {max_connections} connections)...")
+        os.makedirs(out_dir, exist_ok=True)
+        
+        # spawn rather than fork: children must not inherit the parent's pooled connections
+        context = multiprocessing.get_context('spawn')
+        db_slots = context.BoundedSemaphore(max_connections)
+        results, failures = [], []
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                 initializer=_init_worker, initargs=(db_slots,)) as pool:
+            futures = {
+                pool.submit(build_shop_report, shop, start_date, end_date, bucket, out_dir, with_sales, fmt): shop
+                for shop in shop_rows
+            }
+            for future in as_completed(futures):
+                shop = futures[future]
+                label = shop['shop_name'] or shop['email']
+                try:
+                    results.append(future.result())
+                    print(f"   ✅ {label}")
+                except Exception as e:
+                    failures.append({'shop_id': shop['shop_id'], 'email': shop['email'], 'error': str(e)})
+                    print(f"   ❌ {label}: {e}")
+        
+        shop_totals = sorted((result['shop'] for result in results), key=lambda row: -row['profit'])
+        extension = EXPORT_FORMATS[fmt][0]
+        write_frame(pd.DataFrame(shop_totals, columns=SHOPS_SCHEMA.names),
+                    os.path.join(out_dir, f'shops.{extension}'), SHOPS_SCHEMA, fmt)
+        product_rows = [row for result in results for row in result['products']]
+        write_frame(pd.DataFrame(product_rows, columns=SHOP_PRODUCTS_SCHEMA.names),
+                    os.path.join(out_dir, f'products.{extension}'), SHOP_PRODUCTS_SCHEMA, fmt)
+        
+        grand_totals = report_metrics({
+            column: round(sum(row[column] for row in shop_totals), 2) for column in TOTAL_COLUMNS
+        })
+        with open(os.path.join(out_dir, 'summary.json'), 'w') as f:
+            json.dump({
+                'generated_at': datetime.now().isoformat(timespec='seconds'),
+                'start_date': start_date.isoformat(),
+                'end_date': end_date.isoformat(),
+                'bucket': bucket or 'auto',
+                'shops': len(shop_totals),
+                'totals': grand_totals,
+                'failures': failures,
+            }, f, indent=2)
+        
+        print(f"✅ Wrote {len(shop_totals)} shop report(s) to {out_dir}!")
+        print(f"   Revenue KSh {grand_totals['revenue']:,.2f}, profit KSh {grand_totals['profit']:,.2f}")
+        if failures:
+            print(f"ERROR: {len(failures)} shop(s) failed; see summary.json")
+        return not failures
+    
+    except Exception as e:
+        print(f"ERROR: Failed to generate reports: {e}")
+        return False
+
+def last_month() -> tuple:
+    """First and last day of the previous calendar month."""
+    end_date = date.today().replace(day=1) - timedelta(days=1)
+    return end_date.replace(day=1), end_date
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build View Reports metrics for many shops at once.")
+    parser.add_argument("--month", type=parse_month, help="Report on one month (YYYY-MM); defaults to last month")
+    parser.add_argument("--start", type=parse_date, help="First day (YYYY-MM-DD), with --end")
+    parser.add_argument("--end", type=parse_date, help="Last day (YYYY-MM-DD), with --start")
+    parser.add_argument("--shop", action="append", default=[], help="Shop id or email (repeatable); defaults to all")
+    parser.add_argument("--bucket", choices=['day', 'week', 'month'], help="Trend bucket; chosen from the range by default")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument("--max-connections", type=int, default=4, help="Workers querying the database at once")
+    parser.add_argument("--with-sales", action="store_true", help="Also write each shop's row-level sales")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS), default='csv', help="Format of the report files")
+    parser.add_argument("--out", help="Output directory (defaults to batch_reports/<start>_<end>)")
+    args = parser.parse_args()
+    
+    if args.start or args.end:
+        if not (args.start and args.end) or args.month:
+            parser.error("pass both --start and --end, or --month")
+        start_date, end_date = args.start, args.end
+    elif args.month:
+        start_date, end_date = args.month, add_months(args.month, 1) - timedelta(days=1)
+    else:
+        start_date, end_date = last_month()
+    if start_date > end_date:
+        parser.error("--start must not be after --end")
+    if args.workers < 1 or args.max_connections < 1:
+        parser.error("--workers and --max-connections must be at least 1")
+    
+    out_dir = args.out or os.path.join("batch_reports", f"{start_date:%Y%m%d}_{end_date:%Y%m%d}")
+    
+    print("📊 Generating Pima Batch Reports...")
+    print("=" * 50)
+    
+    success = generate_reports(start_date, end_date, out_dir, args.shop, args.bucket,
+                               args.workers, min(args.max_connections, args.workers), args.with_sales,
+                               args.format)
+    
+    if success:
+        print("\n" + "=" * 50)
+        print("🎉 Batch reports completed!")
+    else:
+        print("\n❌ Batch reports failed!")
+        print("Please check the error messages above and try again.")
+        raise SystemExit(1)
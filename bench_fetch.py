@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Before/after comparison for the report fetch path.
+Simulates the text values libpq hands to psycopg2 for a sales report and
+times how long each path takes to turn them into a DataFrame, along with
+its peak Python memory. No database is needed.
+
+  before: RealDictCursor rows (Decimal, date) -> list of dicts -> DataFrame
+  after:  tuple rows (float, ISO text) -> typed column arrays -> DataFrame
+
+The after path runs db.fetch_frame's own typecasters and frame builder on a
+fake cursor, so it measures the code that ships.
+"""
+
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pandas as pd
+from psycopg2.extensions import DATE, INTEGER
+
+import db
+
+Column = namedtuple('Column', ['name', 'type_code'])
+NUMERIC_OID = 1700
+
+# Result columns of the sales report, as a cursor describes them
+REPORT_DESCRIPTION = [
+    Column('date', DATE.values[0]),
+    Column('name', 25),
+    Column('buying_price', NUMERIC_OID),
+    Column('selling_price', NUMERIC_OID),
+    Column('quantity', INTEGER.values[0]),
+    Column('profit', NUMERIC_OID),
+]
+
+def make_raw_rows(row_count: int) -> list:
+    """Raw text rows shaped like the get_sales_report result set."""
+    random.seed(42)
+    start = date(2024, 1, 1)
+    rows = []
+    for _ in range(row_count):
+        buying = random.randint(50, 5000)
+        selling = buying + random.randint(1, 500)
+        quantity = random.randint(1, 20)
+        rows.append((
+            (start + timedelta(days=random.randint(0, 364))).isoformat(),
+            f"Product {random.randint(1, 200)}",
+            f"{buying}.00",
+            f"{selling}.00",
+            str(quantity),
+            f"{(selling - buying) * quantity}.00",
+        ))
+    return rows
+
+def before(raw_rows: list) -> pd.DataFrame:
+    """Previous path: dict per row from RealDictCursor, then a second list of dicts."""
+    columns = ['date', 'name', 'buying_price', 'selling_price', 'quantity', 'profit']
+    sales_data = [
+        dict(zip(columns, (date.fromisoformat(r[0]), r[1], Decimal(r[2]), Decimal(r[3]), int(r[4]), Decimal(r[5]))))
+        for r in raw_rows
+    ]
+    processed_data = []
+    for sale in sales_data:
+        profit = (float(sale['selling_price']) - float(sale['buying_price'])) * sale['quantity']
+        processed_data.append({
+            'date': sale['date'],
+            'name': sale['name'],
+            'buying_price': float(sale['buying_price']),
+            'selling_price': float(sale['selling_price']),
+            'quantity': sale['quantity'],
+            'profit': profit
+        })
+    return pd.DataFrame(processed_data)
+
+class FakeCursor:
+    """Hands out raw text rows through the typecasters fetch_frame registers on its cursor."""
+
+    def __init__(self, raw_rows: list, description: list):
+        self.raw_rows = raw_rows
+        self.description = description
+
+    def fetchall(self) -> list:
+        casters = []
+        for column in self.description:
+            if column.type_code == NUMERIC_OID:
+                casters.append(db._NUMERIC_AS_FLOAT)
+            elif column.type_code in db.DATE_OIDS:
+                casters.append(db._DATE_AS_TEXT)
+            elif column.type_code in db.INT_OIDS:
+                casters.append(INTEGER)
+            else:
+                casters.append(None)
+        return [
+            tuple(value if cast is None else cast(value, self) for cast, value in zip(casters, row))
+            for row in self.raw_rows
+        ]
+
+def after(raw_rows: list) -> pd.DataFrame:
+    """fetch_frame path: tuples with float numerics, then db's typed column arrays."""
+    cur = FakeCursor(raw_rows, REPORT_DESCRIPTION)
+    return db._frame_from_rows(cur.fetchall(), cur.description)
+
+def measure(label: str, func, raw_rows: list) -> dict:
+    """Time one path and record its peak traced memory."""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    df = func(raw_rows)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'path': label,
+        'seconds': round(elapsed, 3),
+        'peak_mb': round(peak / 1024 / 1024, 1),
+        'frame_mb': round(df.memory_usage(deep=True).sum() / 1024 / 1024, 1),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the old and new report fetch paths.")
+    parser.add_argument("--rows", type=int, default=200_000, help="Number of simulated sales rows")
+    args = parser.parse_args()
+
+    raw_rows = make_raw_rows(args.rows)
+    results = [measure('before', before, raw_rows), measure('after', after, raw_rows)]
+
+    print(f"Fetch path comparison for {args.rows:,} rows")
+    print("=" * 50)
+    print(pd.DataFrame(results).to_string(index=False))
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Data layer benchmark for Pima app with PostgreSQL
+Seeds synthetic shops, products and sales, then measures each data function
+for p50/p95 latency, rows transferred from the database and peak Python
+memory. Results are saved as JSON so runs can be compared over time.
+
+The raising fetch_* functions are timed rather than the page's get_*
+wrappers, which turn errors into an empty result; any error fails the run.
+
+Point BENCH_DATABASE_URL (or --database-url) at a local database. Seeded
+accounts use @pima.test emails and are replaced on every --seed run; other
+data is left alone.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import date, datetime, timedelta
+from dotenv import load_dotenv
+from db import execute_query, transaction
+from metrics import metrics
+from inventory import rebuild_balances
+from partitions import ensure_partitions
+from passwords import hash_password
+from reports import rebuild_daily_summary
+
+# Load environment variables
+load_dotenv()
+
+BENCH_EMAIL_PATTERN = 'bench-%@pima.test'
+BENCH_PASSWORD = 'Bench#Passw0rd'
+RESULTS_DIR = 'bench_results'
+
+SEED_SQL = [
+    # Users and shops
+    """
+    INSERT INTO users (id, email, password_hash)
+    SELECT uuid_generate_v4(), 'bench-' || g || '@pima.test', %(password_hash)s
+    FROM generate_series(1, %(shops)s) g
+    """,
+    """
+    INSERT INTO shops (id, shop_name)
+    SELECT id, 'Bench Shop ' || split_part(split_part(email, '@', 1), '-', 2)
+    FROM users WHERE email LIKE %(pattern)s
+    """,
+    # Products with a random positive margin
+    """
+    INSERT INTO products (shop_id, name, buying_price, selling_price)
+    SELECT shop_id, name, buying_price, buying_price + round((1 + random() * 200)::numeric, 2)
+    FROM (
+        SELECT u.id AS shop_id, 'Product ' || g AS name, round((10 + random() * 1000)::numeric, 2) AS buying_price
+        FROM users u CROSS JOIN generate_series(1, %(products)s) g
+        WHERE u.email LIKE %(pattern)s
+    ) t
+    """,
+    # Sales spread uniformly over the last N days, at each product's prices
+    """
+    WITH shop_products AS (
+        SELECT p.shop_id, array_agg(p.id) AS ids
+        FROM products p JOIN users u ON u.id = p.shop_id
+        WHERE u.email LIKE %(pattern)s
+        GROUP BY p.shop_id
+    ), picked AS (
+        SELECT sp.shop_id,
+               sp.ids[1 + floor(random() * array_length(sp.ids, 1))::int] AS product_id,
+               1 + floor(random() * 10)::int AS quantity,
+               CURRENT_DATE - floor(random() * %(days)s)::int AS date
+        FROM shop_products sp CROSS JOIN generate_series(1, %(sales)s) g
+    )
+    INSERT INTO sales (shop_id, product_id, quantity, date, buying_price, selling_price)
+    SELECT k.shop_id, k.product_id, k.quantity, k.date, p.buying_price, p.selling_price
+    FROM picked k JOIN products p ON p.id = k.product_id
+    """,
+]
+
+def seed(shops: int, products: int, sales: int, days: int):
+    """Replace the benchmark shops with freshly generated data."""
+    # One hash shared by every benchmark account keeps seeding fast
+    password_hash = hash_password(BENCH_PASSWORD)
+    params = {
+        'shops': shops, 'products': products, 'sales': sales, 'days': days,
+        'password_hash': password_hash, 'pattern': BENCH_EMAIL_PATTERN,
+    }
+    ensure_partitions('sales', [date.today() - timedelta(days=i) for i in range(days)])
+    
+    with transaction() as cur:
+        cur.execute("DELETE FROM users WHERE email LIKE %s", (BENCH_EMAIL_PATTERN,))
+        for statement in SEED_SQL:
+            cur.execute(statement, params)
+    
+    # Only the seeded shops' derived rows are rebuilt
+    for shop_id, _ in bench_shops():
+        rebuild_daily_summary(shop_id)
+        rebuild_balances(shop_id)
+    execute_query("ANALYZE")
+
+def bench_shops() -> list:
+    """Return (shop_id, email) for every seeded benchmark shop."""
+    rows = execute_query(
+        "SELECT id, email FROM users WHERE email LIKE %s ORDER BY email",
+        (BENCH_EMAIL_PATTERN,),
+        fetch=True
+    )
+    return [(str(row['id']), row['email']) for row in rows]
+
+class QueryRows:
+    """Query hook (see metrics.add_query_hook) totalling rows transferred from the database."""
+    
+    def __init__(self):
+        self.records = []
+    
+    def __call__(self, record: dict):
+        # Called from query worker threads too; list.append is atomic
+        self.records.append(record['rows'])
+    
+    def take(self) -> int:
+        """Rows since the last call."""
+        records, self.records = self.records, []
+        return sum(records)
+
+def sign_in_or_raise(app, email: str):
+    """sign_in reports failures as a message; raise it so the run fails."""
+    user, error = app.sign_in(email, BENCH_PASSWORD)
+    if error:
+        raise RuntimeError(error)
+    return user
+
+def build_cases(app, range_days: int) -> dict:
+    """Map benchmark names to callables taking (shop_id, email, day)."""
+    def report_range(day):
+        return day - timedelta(days=range_days - 1), day
+    
+    return {
+        'fetch_products': lambda shop_id, email, day: app.fetch_products(shop_id),
+        'fetch_daily_profit': lambda shop_id, email, day: app.fetch_daily_profit(shop_id, day),
+        'fetch_period_comparison': lambda shop_id, email, day: app.fetch_period_comparison(shop_id, day),
+        'fetch_sales_report': lambda shop_id, email, day: app.fetch_sales_report(shop_id, *report_range(day)),
+        'fetch_sales_page': lambda shop_id, email, day: app.fetch_sales_page(shop_id, *report_range(day)),
+        'fetch_report_aggregates': lambda shop_id, email, day: app.fetch_report_aggregates(shop_id, *report_range(day)),
+        'sign_in': lambda shop_id, email, day: sign_in_or_raise(app, email),
+    }
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def run_case(app, func, shops: list, iterations: int, days: int, query_rows: QueryRows) -> dict:
+    """Time one data function over random shops and days."""
+    latencies = []
+    rows = []
+    
+    for _ in range(iterations):
+        shop_id, email = random.choice(shops)
+        day = date.today() - timedelta(days=random.randint(0, max(days - 1, 0)))
+        # Measure the database path, not the read cache
+        app.shop_cache.clear()
+        
+        query_rows.take()
+        started = time.perf_counter()
+        func(shop_id, email, day)
+        latencies.append((time.perf_counter() - started) * 1000)
+        rows.append(query_rows.take())
+    
+    # Separate pass so tracemalloc overhead does not skew the latencies
+    shop_id, email = random.choice(shops)
+    app.shop_cache.clear()
+    tracemalloc.start()
+    func(shop_id, email, date.today())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'mean_ms': round(statistics.mean(latencies), 2),
+        'rows_mean': round(statistics.mean(rows), 1),
+        'rows_max': max(rows),
+        'peak_memory_mb': round(peak / 1024 / 1024, 2),
+    }
+
+def git_commit() -> str:
+    """Current commit, so results can be matched to code."""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return 'unknown'
+
+def run_benchmark(args) -> dict:
+    """Optionally seed, then benchmark every data function."""
+    if args.seed:
+        print(f"Seeding {args.shops} shops x {args.products} products x {args.sales} sales over {args.days} days...")
+        started = time.perf_counter()
+        seed(args.shops, args.products, args.sales, args.days)
+        print(f"✅ Seeded in {time.perf_counter() - started:.1f}s")
+    
+    shops = bench_shops()
+    if not shops:
+        raise RuntimeError("No benchmark shops found; run with --seed first")
+    
+    # Imported late so DATABASE_URL already points at the benchmark database
+    import app
+    
+    query_rows = QueryRows()
+    metrics.add_query_hook(query_rows)
+    
+    random.seed(args.random_seed)
+    cases = build_cases(app, args.range_days)
+    selected = args.only or list(cases)
+    unknown = [name for name in selected if name not in cases]
+    if unknown:
+        raise ValueError(f"Unknown benchmark(s): {', '.join(unknown)}; choose from {', '.join(cases)}")
+    
+    results = {}
+    for name in selected:
+        iterations = args.sign_in_iterations if name == 'sign_in' else args.iterations
+        print(f"Benchmarking {name} ({iterations} iterations)...")
+        results[name] = run_case(app, cases[name], shops, iterations, args.days, query_rows)
+        print(f"   p50 {results[name]['p50_ms']} ms, p95 {results[name]['p95_ms']} ms, "
+              f"{results[name]['rows_mean']} rows, {results[name]['peak_memory_mb']} MB peak")
+    
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'config': {
+            'shops': len(shops),
+            'products_per_shop': args.products,
+            'sales_per_shop': args.sales,
+            'days': args.days,
+            'range_days': args.range_days,
+        },
+        'results': results,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Seed synthetic data and benchmark the Pima data layer.")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL"),
+                        help="Benchmark database (defaults to BENCH_DATABASE_URL)")
+    parser.add_argument("--seed", action="store_true", help="Replace benchmark shops with fresh synthetic data")
+    parser.add_argument("--shops", type=int, default=20, help="Shops to seed")
+    parser.add_argument("--products", type=int, default=50, help="Products per shop")
+    parser.add_argument("--sales", type=int, default=20000, help="Sales per shop")
+    parser.add_argument("--days", type=int, default=365, help="Days of sales history")
+    parser.add_argument("--range-days", type=int, default=30, help="Report range length in days")
+    parser.add_argument("--iterations", type=int, default=50, help="Calls per data function")
+    parser.add_argument("--sign-in-iterations", type=int, default=10, help="Calls to sign_in (bcrypt is slow)")
+    parser.add_argument("--only", nargs='+', help="Only run these benchmarks")
+    parser.add_argument("--random-seed", type=int, default=42, help="Seed for shop/day selection")
+    parser.add_argument("--out", help="JSON results file (defaults to bench_results/benchmark_<time>.json)")
+    args = parser.parse_args()
+    
+    if not args.database_url:
+        parser.error("set BENCH_DATABASE_URL or pass --database-url")
+    os.environ["DATABASE_URL"] = args.database_url
+    
+    print("⏱️  Benchmarking Pima Data Layer...")
+    print("=" * 50)
+    
+    try:
+        report = run_benchmark(args)
+    except Exception as e:
+        print(f"\n❌ Benchmark failed: {e}")
+        raise SystemExit(1)
+    
+    out_path = args.out or os.path.join(RESULTS_DIR, f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    with open(out_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    print("\n" + "=" * 50)
+    print(f"🎉 Benchmark completed! Results saved to {out_path}")
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Bulk CSV import for Pima app with NeonDB PostgreSQL
+Loads historical sales or stock for one shop. Every row is validated and
+product names are resolved to ids in memory first; valid files are then
+loaded with COPY in a single transaction, so a bad file changes nothing.
+
+CSV columns: product, quantity, date (YYYY-MM-DD)
+"""
+
+import argparse
+import csv
+import io
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from db import execute_query, transaction
+from inventory import BALANCE_CONFLICT_SQL
+from partitions import ensure_partitions
+from reports import SUMMARY_CONFLICT_SQL
+
+# Load environment variables
+load_dotenv()
+
+IMPORT_KINDS = ('sales', 'stock')
+REQUIRED_COLUMNS = ('product', 'quantity', 'date')
+
+# Sales must sell at least one item; stock deliveries may record zero
+MIN_QUANTITY = {'sales': 1, 'stock': 0}
+
+STAGING_SQL = """
+    CREATE TEMP TABLE import_staging (
+        product_id UUID NOT NULL,
+        quantity INTEGER NOT NULL,
+        date DATE NOT NULL
+    ) ON COMMIT DROP
+"""
+
+def load_product_map(shop_id: str) -> Dict[str, Optional[str]]:
+    """
+    Map normalized product names to ids for a shop.
+    Names shared by several products map to None so they are reported as ambiguous.
+    """
+    products = execute_query(
+        "SELECT id, name FROM products WHERE shop_id = %s",
+        (shop_id,),
+        fetch=True
+    )
+    
+    product_map = {}
+    for product in products:
+        key = product['name'].strip().lower()
+        product_map[key] = None if key in product_map else str(product['id'])
+    return product_map
+
+def parse_import_csv(file_obj, kind: str, product_map: Dict[str, Optional[str]]) -> Tuple[List[tuple], List[dict]]:
+    """
+    Validate a CSV file and resolve product names.
+    Returns (rows, errors) where rows are (product_id, quantity, date) tuples
+    and errors are {'row': line number, 'error': message} dicts.
+    """
+    if kind not in IMPORT_KINDS:
+        raise ValueError(f"Unknown import kind '{kind}'; expected one of {', '.join(IMPORT_KINDS)}")
+    
+    reader = csv.DictReader(file_obj)
+    header = [column.strip().lower() for column in (reader.fieldnames or [])]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        return [], [{'row': 1, 'error': f"Missing column(s): {', '.join(missing)}"}]
+    reader.fieldnames = header
+    
+    rows = []
+    errors = []
+    min_quantity = MIN_QUANTITY[kind]
+    
+    # Line 1 is the header
+    for line_number, record in enumerate(reader, start=2):
+        product_name = (record.get('product') or '').strip()
+        quantity_text = (record.get('quantity') or '').strip()
+        date_text = (record.get('date') or '').strip()
+        
+        row_errors = []
+        
+        key = product_name.lower()
+        product_id = product_map.get(key)
+        if not product_name:
+            row_errors.append("Product is required")
+        elif key not in product_map:
+            row_errors.append(f"Unknown product '{product_name}'")
+        elif product_id is None:
+            row_errors.append(f"Product name '{product_name}' matches several products")
+        
+        try:
+            quantity = int(quantity_text)
+            if quantity < min_quantity:
+                row_errors.append(f"Quantity must be at least {min_quantity}")
+        except ValueError:
+            row_errors.append(f"Invalid quantity '{quantity_text}'")
+        
+        try:
+            row_date = datetime.strptime(date_text, "%Y-%m-%d").date()
+        except ValueError:
+            row_errors.append(f"Invalid date '{date_text}' (expected YYYY-MM-DD)")
+        
+        if row_errors:
+            errors.append({'row': line_number, 'error': "; ".join(row_errors)})
+        else:
+            rows.append((product_id, quantity, row_date))
+    
+    return rows, errors
+
+def _copy_buffer(rows: List[tuple]) -> io.StringIO:
+    """Serialize validated rows as CSV for COPY."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for product_id, quantity, row_date in rows:
+        writer.writerow((product_id, quantity, row_date.isoformat()))
+    buffer.seek(0)
+    return buffer
+
+def import_rows(shop_id: str, kind: str, rows: List[tuple]) -> int:
+    """
+    Load validated rows with COPY in a single transaction.
+    Imported sales are folded into sales_daily_summary in the same transaction.
+    Returns the number of rows inserted.
+    """
+    if kind not in IMPORT_KINDS:
+        raise ValueError(f"Unknown import kind '{kind}'; expected one of {', '.join(IMPORT_KINDS)}")
+    if not rows:
+        return 0
+    
+    # sales and stock are partitioned by month; create any month the file reaches
+    ensure_partitions(kind, {row_date for _, _, row_date in rows})
+    with transaction() as cur:
+        cur.execute(STAGING_SQL)
+        cur.copy_expert(
+            "COPY import_staging (product_id, quantity, date) FROM STDIN WITH (FORMAT csv)",
+            _copy_buffer(rows)
+        )
+        
+        # Guard against product ids belonging to another shop
+        cur.execute(
+            """
+            SELECT COUNT(*) FROM import_staging st
+            LEFT JOIN products p ON p.id = st.product_id AND p.shop_id = %s
+            WHERE p.id IS NULL
+            """,
+            (shop_id,)
+        )
+        if cur.fetchone()[0]:
+            raise ValueError("Import contains products that do not belong to this shop")
+        
+        if kind == 'sales':
+            cur.execute(
+                """
+                INSERT INTO sales (shop_id, product_id, quantity, date, buying_price, selling_price)
+                SELECT %s, st.product_id, st.quantity, st.date, p.buying_price, p.selling_price
+                FROM import_staging st
+                JOIN products p ON p.id = st.product_id
+                """,
+                (shop_id,)
+            )
+            inserted = cur.rowcount
+            cur.execute(
+                """
+                INSERT INTO sales_daily_summary AS d
+                    (shop_id, product_id, date, sales_count, quantity, revenue, cost, profit)
+                SELECT %s, st.product_id, st.date,
+                       COUNT(*),
+                       SUM(st.quantity),
+                       SUM(p.selling_price * st.quantity),
+                       SUM(p.buying_price * st.quantity),
+                       SUM((p.selling_price - p.buying_price) * st.quantity)
+                FROM import_staging st
+                JOIN products p ON p.id = st.product_id
+                GROUP BY st.product_id, st.date
+                """ + SUMMARY_CONFLICT_SQL,
+                (shop_id,)
+            )
+        else:
+            cur.execute(
+                """
+                INSERT INTO stock (shop_id, product_id, quantity, date)
+                SELECT %s, product_id, quantity, date FROM import_staging
+                """,
+                (shop_id,)
+            )
+            inserted = cur.rowcount
+        
+        # Keep on-hand balances in step with the imported rows
+        column = 'sold' if kind == 'sales' else 'stock_in'
+        cur.execute(
+            f"""
+            INSERT INTO inventory_balances AS b (shop_id, product_id, {column})
+            SELECT %s, product_id, SUM(quantity) FROM import_staging
+            GROUP BY product_id
+            """ + BALANCE_CONFLICT_SQL,
+            (shop_id,)
+        )
+    
+    return inserted
+
+def bulk_import(shop_id: str, kind: str, path: str, dry_run: bool = False) -> bool:
+    """Validate and import a CSV file from disk, printing a per-row error report."""
+    if not os.getenv("DATABASE_URL"):
+        print("ERROR: DATABASE_URL environment variable is not set!")
+        return False
+    
+    try:
+        print("Connecting to NeonDB PostgreSQL...")
+        product_map = load_product_map(shop_id)
+        
+        print(f"Validating {path}...")
+        with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+            rows, errors = parse_import_csv(f, kind, product_map)
+        
+        if errors:
+            print(f"❌ {len(errors)} invalid row(s); nothing was imported:")
+            for error in errors:
+                print(f"   Row {error['row']}: {error['error']}")
+            return False
+        
+        if dry_run:
+            print(f"✅ {len(rows)} {kind} row(s) are valid (dry run, nothing imported).")
+            return True
+        
+        print(f"Importing {len(rows)} {kind} row(s)...")
+        inserted = import_rows(shop_id, kind, rows)
+        print(f"✅ Imported {inserted} {kind} row(s)!")
+        return True
+    
+    except FileNotFoundError:
+        print(f"ERROR: {path} not found!")
+        return False
+    except Exception as e:
+        print(f"ERROR: Failed to import data: {e}")
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import historical sales or stock from CSV.")
+    parser.add_argument("kind", choices=IMPORT_KINDS, help="What the file contains")
+    parser.add_argument("path", help="CSV file with product, quantity and date columns")
+    parser.add_argument("--shop-id", required=True, help="Shop to import into")
+    parser.add_argument("--dry-run", action="store_true", help="Validate only, do not import")
+    args = parser.parse_args()
+    
+    print("📦 Importing Pima Data...")
+    print("=" * 50)
+    
+    success = bulk_import(args.shop_id, args.kind, args.path, args.dry_run)
+    
+    if success:
+        print("\n" + "=" * 50)
+        print("🎉 Import completed!")
+    else:
+        print("\n❌ Import failed!")
+        print("Please fix the rows listed above and try again.")
+        raise SystemExit(1)
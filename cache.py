@@ -0,0 +1,109 @@
+"""
+Per-shop read cache for Pima app.
+
+Cached reads are shared by every Streamlit session in the process and keyed
+by shop, so one shop's writes invalidate only that shop's entries. Entries
+expire after a TTL and the least recently used entries are evicted once the
+cache is full. Cached values are shared between sessions and must be treated
+as read-only.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class ShopCache:
+    """Bounded TTL + LRU cache with per-shop invalidation."""
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 300.0):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries = OrderedDict()  # (shop_id, key) -> (expires_at, value)
+        self._keys_by_shop = {}  # shop_id -> set of (shop_id, key)
+        self._generations = {}  # shop_id -> invalidation counter
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'invalidations': 0}
+
+    def _remove(self, entry_key: tuple):
+        """Drop an entry and its shop index reference. Caller holds the lock."""
+        self._entries.pop(entry_key, None)
+        shop_keys = self._keys_by_shop.get(entry_key[0])
+        if shop_keys is not None:
+            shop_keys.discard(entry_key)
+            if not shop_keys:
+                del self._keys_by_shop[entry_key[0]]
+
+    def get_or_load(self, shop_id: str, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for (shop_id, key), calling loader on a miss."""
+        shop_id = str(shop_id)
+        entry_key = (shop_id, key)
+
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(entry_key)
+                    self._stats['hits'] += 1
+                    return value
+                self._remove(entry_key)
+                self._stats['expirations'] += 1
+            self._stats['misses'] += 1
+            generation = self._generations.get(shop_id, 0)
+
+        # Load outside the lock; errors propagate and nothing is cached
+        value = loader()
+
+        with self._lock:
+            # A write invalidated this shop while we were loading, so the value may be stale
+            if self._generations.get(shop_id, 0) != generation:
+                return value
+
+            self._entries[entry_key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(entry_key)
+            self._keys_by_shop.setdefault(shop_id, set()).add(entry_key)
+
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self._stats['evictions'] += 1
+
+        return value
+
+    def invalidate_shop(self, shop_id: str) -> int:
+        """Drop every entry for a shop. Returns the number of entries removed."""
+        shop_id = str(shop_id)
+        with self._lock:
+            self._generations[shop_id] = self._generations.get(shop_id, 0) + 1
+            entry_keys = list(self._keys_by_shop.get(shop_id, ()))
+            for entry_key in entry_keys:
+                self._remove(entry_key)
+            self._stats['invalidations'] += 1
+            return len(entry_keys)
+
+    def clear(self):
+        """Drop every entry."""
+        with self._lock:
+            for shop_id in list(self._keys_by_shop):
+                self._generations[shop_id] = self._generations.get(shop_id, 0) + 1
+            self._entries.clear()
+            self._keys_by_shop.clear()
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current size."""
+        with self._lock:
+            return {**self._stats, 'entries': len(self._entries), 'max_entries': self.max_entries}
+
+
+# Process-wide cache shared by all sessions
+shop_cache = ShopCache(
+    max_entries=int(os.getenv("SHOP_CACHE_MAX_ENTRIES", "1024")),
+    ttl=float(os.getenv("SHOP_CACHE_TTL", "300")),
+)
@@ -0,0 +1,73 @@
+"""
+Chart data helpers for Pima app.
+
+Plotly slows down and becomes unreadable with thousands of points per
+line, so trend series are reduced with Largest-Triangle-Three-Buckets
+(LTTB) before plotting. LTTB keeps the first and last points and, from
+each bucket in between, the point that best preserves the series' shape,
+so peaks and dips survive. Set CHART_MAX_POINTS=0 to plot every point.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "500"))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """Indices of the points LTTB keeps to draw (x, y) with at most max_points."""
+    n = len(x)
+    if max_points <= 0 or n <= max_points or max_points < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (max_points - 2)
+    kept = np.empty(max_points, dtype=np.int64)
+    kept[0] = 0
+    a = 0
+
+    for i in range(max_points - 2):
+        # Average of the next bucket is the third corner of the triangle
+        next_start = int(np.floor((i + 1) * every)) + 1
+        next_end = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        start = int(np.floor(i * every)) + 1
+        end = int(np.floor((i + 1) * every)) + 1
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+
+    kept[-1] = n - 1
+    return kept
+
+
+def downsample(df: pd.DataFrame, x: str, y: str, max_points: int = CHART_MAX_POINTS) -> pd.DataFrame:
+    """Rows of df (sorted by x) that keep one series under max_points with LTTB."""
+    if max_points <= 0 or len(df) <= max_points:
+        return df
+    df = df.sort_values(x)
+    x_values = df[x].to_numpy()
+    if np.issubdtype(x_values.dtype, np.datetime64):
+        x_values = x_values.astype('datetime64[ns]').astype(np.int64)
+    x_values = x_values.astype(np.float64)
+    y_values = df[y].to_numpy(dtype=np.float64)
+    return df.iloc[lttb_indices(x_values, y_values, max_points)]
+
+
+def downsample_series(df: pd.DataFrame, x: str, y_columns: list,
+                      max_points: int = CHART_MAX_POINTS) -> pd.DataFrame:
+    """
+    Long-form (x, 'series', 'value') frame with each y column downsampled on
+    its own, for plotting several lines with color='series'.
+    """
+    frames = []
+    for column in y_columns:
+        series = downsample(df[[x, column]], x, column, max_points)
+        frames.append(pd.DataFrame({x: series[x].to_numpy(), 'series': column, 'value': series[column].to_numpy()}))
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=[x, 'series', 'value'])
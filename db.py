@@ -0,0 +1,674 @@
+"""
+Database access layer for Pima app with NeonDB PostgreSQL.
+
+Holds a process-wide connection pool shared by every Streamlit session and
+the query helpers built on top of it. Streamlit re-executes app.py on every
+rerun, but imported modules are cached, so the pool survives across reruns.
+
+When REPLICA_DATABASE_URL is set, reads that pass replica=True go to a
+second pool on the read replica while it is reachable and caught up; writes
+and every other read stay on the primary (DATABASE_URL). Give the replica
+DSN a connect_timeout so an unreachable replica fails fast.
+"""
+
+import atexit
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.extras import RealDictCursor
+from dotenv import load_dotenv
+from metrics import metrics
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Errors that mean the connection itself is unusable
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+# A replica lagging further behind than this is skipped until it catches up
+REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "5"))
+# Seconds between replica health checks, and before retrying a failed replica
+REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", "5"))
+# Reads for a key stay on the primary this long after a write, so users see their own writes
+REPLICA_STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "10"))
+
+# Queries run_concurrently may have in flight at once, each on its own pooled connection
+CONCURRENT_QUERIES = int(os.getenv("DB_CONCURRENT_QUERIES", "4"))
+
+# PostgreSQL type OIDs used to pick column dtypes in fetch_frame
+FLOAT_OIDS = {700, 701, 1700}  # float4, float8, numeric
+INT_OIDS = {20, 21, 23}  # int8, int2, int4
+DATE_OIDS = {1082}  # date
+
+# Cursor-scoped typecasters for fetch_frame: numeric arrives as float instead
+# of Decimal, and dates stay as ISO text so pandas can parse them in one pass
+_NUMERIC_AS_FLOAT = extensions.new_type(
+    (1700,), 'PIMA_NUMERIC_AS_FLOAT',
+    lambda value, cur: float(value) if value is not None else None
+)
+_DATE_AS_TEXT = extensions.new_type((1082,), 'PIMA_DATE_AS_TEXT', lambda value, cur: value)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe PostgreSQL connection pool.
+    Connections are health-checked on checkout and replaced when broken.
+    """
+
+    def __init__(self, dsn: str, minconn: int = 1, maxconn: int = 10,
+                 timeout: float = 30.0, health_check_interval: float = 30.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Pool sizes must satisfy 0 <= minconn <= maxconn and maxconn >= 1")
+
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = []  # list of (connection, last_used_monotonic)
+        self._in_use = set()
+        self._opening = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self._stats = {
+            'connections_opened': 0,
+            'connections_discarded': 0,
+            'checkouts': 0,
+            'health_checks': 0,
+            'health_check_failures': 0,
+            'waits': 0,
+            'timeouts': 0,
+        }
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._stats['connections_opened'] += 1
+
+    def _connect(self):
+        """Open a new physical connection."""
+        return psycopg2.connect(self.dsn)
+
+    def _close_quietly(self, conn):
+        """Close a connection, ignoring errors from already broken sockets."""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._stats['connections_discarded'] += 1
+
+    def _is_healthy(self, conn, last_used: float) -> bool:
+        """Check a connection before handing it out."""
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+
+        # Connection has been idle long enough that the server or a proxy may have dropped it
+        self._stats['health_checks'] += 1
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except Exception:
+            self._stats['health_check_failures'] += 1
+            return False
+
+    def getconn(self):
+        """Check out a healthy connection, waiting up to the pool timeout."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            last_used = None
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise psycopg2.InterfaceError("Connection pool is closed")
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        # Reserve its slot while it is checked outside the lock
+                        self._in_use.add(conn)
+                        break
+                    if len(self._in_use) + self._opening < self.maxconn:
+                        self._opening += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f"No database connection available after {self.timeout:.0f}s")
+                    self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+
+            # Network work happens outside the lock so other sessions are not blocked
+            if conn is not None:
+                if self._is_healthy(conn, last_used):
+                    return self._checkout(conn)
+                with self._cond:
+                    self._in_use.discard(conn)
+                    self._close_quietly(conn)
+                    self._cond.notify()
+                continue
+
+            try:
+                conn = self._connect()
+            finally:
+                with self._cond:
+                    self._opening -= 1
+                    if conn is None:
+                        self._cond.notify()
+                    else:
+                        self._stats['connections_opened'] += 1
+            return self._checkout(conn)
+
+    def _checkout(self, conn):
+        """Mark a connection as handed out."""
+        with self._cond:
+            self._in_use.add(conn)
+            self._stats['checkouts'] += 1
+        return conn
+
+    def putconn(self, conn, discard: bool = False):
+        """Return a connection to the pool, or close it if broken or discarded."""
+        with self._cond:
+            self._in_use.discard(conn)
+
+            if not discard and not conn.closed:
+                # Never hand out a connection with an open transaction
+                try:
+                    if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                except Exception:
+                    discard = True
+
+            if discard or conn.closed or self._closed:
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+
+            self._cond.notify()
+            below_min = self._size() < self.minconn and not self._closed
+
+        if below_min:
+            # Reconnecting may block, so the caller returning a broken connection does not wait
+            threading.Thread(target=self._top_up, name="db-pool-top-up", daemon=True).start()
+
+    def _size(self) -> int:
+        """Connections open or being opened. Call with the lock held."""
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _top_up(self):
+        """Reopen connections until the pool is back to minconn."""
+        while True:
+            with self._cond:
+                if self._closed or self._size() >= self.minconn:
+                    return
+                self._opening += 1
+
+            conn = None
+            try:
+                conn = self._connect()
+            except Exception:
+                # Database unreachable; checkouts open connections on demand
+                pass
+            finally:
+                with self._cond:
+                    self._opening -= 1
+                    if conn is not None:
+                        self._stats['connections_opened'] += 1
+                        if self._closed:
+                            self._close_quietly(conn)
+                        else:
+                            self._idle.append((conn, time.monotonic()))
+                    self._cond.notify()
+            if conn is None:
+                return
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and always returns it."""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, discard=broken or bool(conn.closed))
+
+    def stats(self) -> dict:
+        """Return a snapshot of pool counters and current sizes."""
+        with self._cond:
+            return {
+                **self._stats,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'minconn': self.minconn,
+                'maxconn': self.maxconn,
+            }
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts."""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._close_quietly(conn)
+            self._cond.notify_all()
+
+
+# Process-wide pool singleton
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the shared connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                database_url = os.getenv("DATABASE_URL")
+                if not database_url:
+                    raise RuntimeError("DATABASE_URL environment variable is required but not set.")
+                _pool = ConnectionPool(
+                    database_url,
+                    minconn=int(os.getenv("DB_POOL_MIN", "1")),
+                    maxconn=int(os.getenv("DB_POOL_MAX", "10")),
+                    timeout=float(os.getenv("DB_POOL_TIMEOUT", "30")),
+                    health_check_interval=float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30")),
+                )
+                atexit.register(_pool.closeall)
+    return _pool
+
+
+def get_pool_stats() -> dict:
+    """Return statistics for the shared pool, or an empty dict if it is not open yet."""
+    return _pool.stats() if _pool is not None else {}
+
+
+# Replica errors that move a read to the primary: an unreachable or saturated
+# replica, or a query cancelled by a conflict with WAL replay
+REPLICA_FALLBACK_ERRORS = CONNECTION_ERRORS + (PoolTimeout, extensions.TransactionRollbackError)
+
+# Replication lag in seconds; zero when fully replayed or when the server is not a standby
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+class ReplicaRouter:
+    """
+    Decides whether a read may use the replica.
+    The replica is used while its last health check found it reachable and
+    within max_lag, and not for keys written in the last sticky_seconds.
+    """
+
+    def __init__(self, max_lag: float = 5.0, check_interval: float = 5.0, sticky_seconds: float = 10.0):
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.sticky_seconds = sticky_seconds
+
+        self._healthy = False
+        self._lag = None
+        self._checked_at = None
+        self._checking = False
+        self._recent_writes = {}  # key -> monotonic time of the last write
+        self._lock = threading.Lock()
+        self._stats = {'replica_reads': 0, 'fallbacks': 0, 'health_checks': 0, 'health_check_failures': 0}
+
+    def note_write(self, key):
+        """Record a write so reads for key stay on the primary for a while."""
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes[key] = now
+            # Forget writes old enough that the replica has them
+            if len(self._recent_writes) > 1024:
+                cutoff = now - self.sticky_seconds
+                self._recent_writes = {k: t for k, t in self._recent_writes.items() if t > cutoff}
+
+    def allows(self, key) -> bool:
+        """Whether reads for key may go to the replica."""
+        with self._lock:
+            written_at = self._recent_writes.get(key)
+        return written_at is None or time.monotonic() - written_at >= self.sticky_seconds
+
+    def is_healthy(self, pool: ConnectionPool) -> bool:
+        """Whether the replica can take reads, re-checking it at most every check_interval."""
+        with self._lock:
+            due = self._checked_at is None or time.monotonic() - self._checked_at >= self.check_interval
+            # One thread checks; the others use the last result meanwhile
+            if not due or self._checking:
+                return self._healthy
+            self._checking = True
+
+        healthy, lag = False, None
+        try:
+            with pool.connection() as conn:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute(REPLICA_LAG_SQL)
+                        lag = float(cur.fetchone()[0])
+                finally:
+                    conn.rollback()
+            healthy = lag <= self.max_lag
+        except Exception:
+            pass
+
+        with self._lock:
+            self._healthy, self._lag = healthy, lag
+            self._checked_at = time.monotonic()
+            self._checking = False
+            self._stats['health_checks'] += 1
+            if not healthy:
+                self._stats['health_check_failures'] += 1
+        return healthy
+
+    def mark_unhealthy(self):
+        """Stop using the replica until the next health check."""
+        with self._lock:
+            self._healthy = False
+            self._checked_at = time.monotonic()
+
+    def record(self, on_replica: bool, fell_back: bool = False):
+        """Count a read served by the replica or moved to the primary."""
+        with self._lock:
+            if on_replica:
+                self._stats['replica_reads'] += 1
+            if fell_back:
+                self._stats['fallbacks'] += 1
+
+    def stats(self) -> dict:
+        """Return a snapshot of routing counters and the last health check."""
+        with self._lock:
+            return {**self._stats, 'healthy': self._healthy, 'lag_seconds': self._lag}
+
+
+replica_router = ReplicaRouter(REPLICA_MAX_LAG, REPLICA_CHECK_INTERVAL, REPLICA_STICKY_SECONDS)
+
+# Process-wide replica pool singleton; stays None without REPLICA_DATABASE_URL
+_replica_pool: Optional[ConnectionPool] = None
+
+
+def get_replica_pool() -> Optional[ConnectionPool]:
+    """Return the read replica pool, or None when no replica is configured."""
+    global _replica_pool
+    if _replica_pool is None:
+        replica_url = os.getenv("REPLICA_DATABASE_URL")
+        if not replica_url:
+            return None
+        with _pool_lock:
+            if _replica_pool is None:
+                # No connections up front, so an unreachable replica cannot break startup
+                _replica_pool = ConnectionPool(
+                    replica_url,
+                    minconn=0,
+                    maxconn=int(os.getenv("DB_REPLICA_POOL_MAX", os.getenv("DB_POOL_MAX", "10"))),
+                    timeout=float(os.getenv("DB_REPLICA_POOL_TIMEOUT", "5")),
+                    health_check_interval=float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", "30")),
+                )
+                atexit.register(_replica_pool.closeall)
+    return _replica_pool
+
+
+def note_write(key):
+    """Keep reads for key (e.g. a shop id) on the primary until the replica has caught up."""
+    replica_router.note_write(key)
+
+
+def replica_ok(key) -> bool:
+    """Whether reads for key may be served by the replica."""
+    return replica_router.allows(key)
+
+
+def read_pool(replica: bool) -> ConnectionPool:
+    """Pool for a read: the replica when requested, configured and healthy, else the primary."""
+    if replica:
+        pool = get_replica_pool()
+        if pool is not None and replica_router.is_healthy(pool):
+            return pool
+    return get_pool()
+
+
+def _fall_back(pool: ConnectionPool, error: Exception) -> bool:
+    """Whether a failed read ran on the replica and should be retried on the primary."""
+    if _replica_pool is None or pool is not _replica_pool:
+        return False
+    if not isinstance(error, extensions.TransactionRollbackError):
+        replica_router.mark_unhealthy()
+    replica_router.record(on_replica=False, fell_back=True)
+    return True
+
+
+metrics.register_gauge('pima_db_pool_in_use', 'Pooled connections checked out.',
+                       lambda: get_pool_stats().get('in_use', 0))
+metrics.register_gauge('pima_db_pool_idle', 'Pooled connections waiting to be reused.',
+                       lambda: get_pool_stats().get('idle', 0))
+metrics.register_gauge('pima_db_pool_connections_opened', 'Physical connections opened since start.',
+                       lambda: get_pool_stats().get('connections_opened', 0))
+metrics.register_gauge('pima_db_replica_healthy', 'Whether reads may use the read replica (1) or not (0).',
+                       lambda: int(replica_router.stats()['healthy']))
+metrics.register_gauge('pima_db_replica_lag_seconds', 'Replication lag seen by the last replica health check.',
+                       lambda: replica_router.stats()['lag_seconds'] or 0)
+metrics.register_gauge('pima_db_replica_reads', 'Reads served by the read replica since start.',
+                       lambda: replica_router.stats()['replica_reads'])
+metrics.register_gauge('pima_db_replica_fallbacks', 'Replica reads retried on the primary since start.',
+                       lambda: replica_router.stats()['fallbacks'])
+
+
+@contextmanager
+def transaction(cursor_factory=None):
+    """
+    Run several statements on one pooled connection in a single transaction.
+    Commits when the block exits cleanly and rolls back on any error.
+    """
+    with get_pool().connection() as conn:
+        try:
+            with conn.cursor(cursor_factory=cursor_factory) as cur:
+                yield cur
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+
+
+def execute_query(query: str, params: tuple = None, fetch: bool = False, replica: bool = False):
+    """
+    Execute a database query and return results if fetch=True.
+    Reads with replica=True may be served by the read replica.
+    """
+    # Reads are safe to replay on a fresh connection; writes are not, since a
+    # broken connection leaves us unsure whether the statement committed.
+    retries = 1 if fetch else 0
+    replica = replica and fetch
+    while True:
+        pool = read_pool(replica)
+        started = time.perf_counter()
+        try:
+            with pool.connection() as conn:
+                connected = time.perf_counter()
+                try:
+                    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                        cur.execute(query, params)
+                        executed = time.perf_counter()
+                        if fetch:
+                            rows = cur.fetchall()
+                            conn.rollback()
+                            metrics.record_query(query, connected - started, executed - connected,
+                                                 time.perf_counter() - executed, len(rows))
+                            replica_router.record(on_replica=pool is _replica_pool)
+                            return rows
+                        conn.commit()
+                        metrics.record_query(query, connected - started, time.perf_counter() - connected,
+                                             0.0, max(cur.rowcount, 0))
+                        return cur.rowcount
+                except Exception:
+                    if not conn.closed:
+                        conn.rollback()
+                    raise
+        except REPLICA_FALLBACK_ERRORS as e:
+            if _fall_back(pool, e):
+                replica = False
+            elif isinstance(e, CONNECTION_ERRORS) and retries:
+                retries -= 1
+            else:
+                raise
+
+
+def execute_query_one(query: str, params: tuple = None):
+    """Execute a database query and return a single result."""
+    for attempt in range(2):
+        started = time.perf_counter()
+        try:
+            with get_pool().connection() as conn:
+                connected = time.perf_counter()
+                try:
+                    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+                        cur.execute(query, params)
+                        executed = time.perf_counter()
+                        row = cur.fetchone()
+                        conn.commit()
+                        metrics.record_query(query, connected - started, executed - connected,
+                                             time.perf_counter() - executed, 1 if row else 0)
+                        return row
+                except Exception:
+                    if not conn.closed:
+                        conn.rollback()
+                    raise
+        except CONNECTION_ERRORS:
+            if attempt == 1:
+                raise
+
+
+def _column_array(values: tuple, type_code: int):
+    """Convert one column of raw cursor values into a typed array."""
+    if type_code in FLOAT_OIDS:
+        return np.array(values, dtype=np.float64)
+    if type_code in INT_OIDS:
+        if None in values:
+            return pd.array(values, dtype='Int64')
+        return np.array(values, dtype=np.int64)
+    if type_code in DATE_OIDS:
+        return pd.to_datetime(pd.Series(values, dtype=object), format='%Y-%m-%d').to_numpy()
+    # Filled element-wise so array values (e.g. text[]) stay one object per row
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _frame_from_rows(rows: list, description) -> pd.DataFrame:
+    """Build a DataFrame from fetched tuples, one typed array per cursor column."""
+    columns = [column.name for column in description]
+    column_values = list(zip(*rows)) if rows else [()] * len(columns)
+    data = {
+        column.name: _column_array(values, column.type_code)
+        for column, values in zip(description, column_values)
+    }
+    return pd.DataFrame(data, columns=columns)
+
+
+def fetch_frame(query: str, params: tuple = None, replica: bool = False) -> pd.DataFrame:
+    """
+    Execute a read query and return a DataFrame built column by column.
+    Rows come back as plain tuples rather than dicts, and dtypes are chosen
+    from the result column types: numeric -> float64, integer -> int64,
+    date -> datetime64. With replica=True the read replica may serve it.
+    """
+    retries = 1
+    while True:
+        pool = read_pool(replica)
+        started = time.perf_counter()
+        try:
+            with pool.connection() as conn:
+                connected = time.perf_counter()
+                try:
+                    with conn.cursor() as cur:
+                        extensions.register_type(_NUMERIC_AS_FLOAT, cur)
+                        extensions.register_type(_DATE_AS_TEXT, cur)
+                        cur.execute(query, params)
+                        executed = time.perf_counter()
+                        rows = cur.fetchall()
+                        description = cur.description
+                    conn.rollback()
+                except Exception:
+                    if not conn.closed:
+                        conn.rollback()
+                    raise
+            break
+        except REPLICA_FALLBACK_ERRORS as e:
+            if _fall_back(pool, e):
+                replica = False
+            elif isinstance(e, CONNECTION_ERRORS) and retries:
+                retries -= 1
+            else:
+                raise
+
+    replica_router.record(on_replica=pool is _replica_pool)
+    frame = _frame_from_rows(rows, description)
+    # Fetch time includes building the typed columns
+    metrics.record_query(query, connected - started, executed - connected,
+                         time.perf_counter() - executed, len(frame))
+    return frame
+
+
+# Worker threads for run_concurrently, created on first use
+_query_executor: Optional[ThreadPoolExecutor] = None
+_query_executor_lock = threading.Lock()
+
+
+def _get_query_executor() -> ThreadPoolExecutor:
+    """Return the shared query executor, creating it on first use."""
+    global _query_executor
+    if _query_executor is None:
+        with _query_executor_lock:
+            if _query_executor is None:
+                _query_executor = ThreadPoolExecutor(
+                    max_workers=max(1, CONCURRENT_QUERIES), thread_name_prefix='pima-query'
+                )
+                atexit.register(_query_executor.shutdown, wait=False)
+    return _query_executor
+
+
+def run_concurrently(calls: dict, return_exceptions: bool = False) -> dict:
+    """
+    Run independent query functions at the same time and return {name: result}.
+
+    Each call checks out its own pooled connection, so the total wait is the
+    slowest call rather than the sum of all of them. Calls must not touch
+    Streamlit state. With return_exceptions, a failed call's exception is
+    returned as its result; otherwise the first failure is raised once every
+    call has finished.
+    """
+    executor = _get_query_executor()
+    # A single call runs inline; there is nothing to overlap it with
+    futures = {name: executor.submit(func) for name, func in calls.items()} if len(calls) > 1 else {}
+    results = {}
+    first_error = None
+    for name, func in calls.items():
+        try:
+            results[name] = futures[name].result() if futures else func()
+        except Exception as e:
+            results[name] = e
+            first_error = first_error or e
+    if first_error is not None and not return_exceptions:
+        raise first_error
+    return results
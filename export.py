@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Streaming sales report export for Pima app with NeonDB PostgreSQL
+CSV rows are streamed from PostgreSQL with COPY ... TO STDOUT straight into
+a file. Parquet and Arrow IPC exports read a server-side cursor in chunks
+of EXPORT_BATCH_ROWS and write each chunk as its own row group / record
+batch with typed columns (date32, decimal prices, int32 quantities), so
+memory stays flat however large the date range is.
+"""
+
+import argparse
+import os
+import tempfile
+from datetime import date, datetime
+from typing import Iterator, Optional
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from db import REPLICA_FALLBACK_ERRORS, read_pool
+from reports import SALES_REPORT_SQL
+
+# Load environment variables
+load_dotenv()
+
+# In-memory exports spill to disk beyond this size
+SPOOL_MAX_BYTES = int(os.getenv("EXPORT_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+# Largest export the web app offers for download; download_button holds it in memory
+DOWNLOAD_MAX_BYTES = int(os.getenv("EXPORT_DOWNLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+
+# Rows fetched per round trip and written per Parquet row group / Arrow record batch
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "50000"))
+PARQUET_COMPRESSION = os.getenv("EXPORT_PARQUET_COMPRESSION", "zstd")
+# Arrow IPC supports lz4 or zstd
+ARROW_COMPRESSION = os.getenv("EXPORT_ARROW_COMPRESSION", "zstd")
+
+# Export format -> (file extension, MIME type)
+EXPORT_FORMATS = {
+    'csv': ('csv', 'text/csv'),
+    'parquet': ('parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('arrow', 'application/vnd.apache.arrow.file'),
+}
+
+# Column types of SALES_REPORT_SQL; prices keep their NUMERIC(10,2) precision
+SALES_SCHEMA = pa.schema([
+    ('date', pa.date32()),
+    ('name', pa.string()),
+    ('buying_price', pa.decimal128(10, 2)),
+    ('selling_price', pa.decimal128(10, 2)),
+    ('quantity', pa.int32()),
+    ('profit', pa.decimal128(20, 2)),
+])
+
+# Column types of the aggregate frames (reports.DAILY_COLUMNS / PRODUCT_COLUMNS);
+# money is already rounded to floats there
+TOTAL_FIELDS = [
+    ('sales_count', pa.int64()),
+    ('quantity', pa.int64()),
+    ('revenue', pa.float64()),
+    ('cost', pa.float64()),
+    ('profit', pa.float64()),
+]
+TREND_SCHEMA = pa.schema([('date', pa.date32())] + TOTAL_FIELDS)
+PRODUCTS_SCHEMA = pa.schema([('product_id', pa.string()), ('name', pa.string())] + TOTAL_FIELDS)
+
+def copy_sales_csv(shop_id: str, start_date: date, end_date: date, out, product_id: Optional[str] = None,
+                   replica: bool = False):
+    """
+    Stream the sales report for a date range as CSV (with header) into a binary file object.
+    With replica=True the read replica may serve it.
+    """
+    product_id = str(product_id) if product_id else None
+    with read_pool(replica).connection() as conn:
+        try:
+            with conn.cursor() as cur:
+                # COPY cannot take bind parameters, so inline them with proper quoting
+                query = cur.mogrify(
+                    SALES_REPORT_SQL,
+                    (shop_id, start_date, end_date, product_id, product_id)
+                ).decode('utf-8')
+                cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", out)
+        finally:
+            conn.rollback()
+
+def sales_record_batches(shop_id: str, start_date: date, end_date: date, product_id: Optional[str] = None,
+                         replica: bool = False, batch_rows: int = EXPORT_BATCH_ROWS) -> Iterator[pa.RecordBatch]:
+    """Yield the sales report as typed record batches of up to batch_rows rows."""
+    product_id = str(product_id) if product_id else None
+    with read_pool(replica).connection() as conn:
+        try:
+            # A named (server-side) cursor sends rows as they are fetched, not all at once
+            with conn.cursor(name='pima_sales_export') as cur:
+                cur.itersize = batch_rows
+                cur.execute(SALES_REPORT_SQL, (shop_id, start_date, end_date, product_id, product_id))
+                while True:
+                    rows = cur.fetchmany(batch_rows)
+                    if not rows:
+                        break
+                    yield pa.RecordBatch.from_arrays(
+                        [pa.array(values, type=field.type) for values, field in zip(zip(*rows), SALES_SCHEMA)],
+                        schema=SALES_SCHEMA
+                    )
+        finally:
+            conn.rollback()
+
+def _batch_writer(out, fmt: str, schema: pa.Schema):
+    """Open a Parquet or Arrow IPC file writer on a path or binary file object."""
+    if fmt == 'parquet':
+        return pq.ParquetWriter(out, schema, compression=PARQUET_COMPRESSION)
+    if fmt == 'arrow':
+        return pa.ipc.new_file(out, schema, options=pa.ipc.IpcWriteOptions(compression=ARROW_COMPRESSION))
+    raise ValueError(f"Unknown columnar format '{fmt}'; expected parquet or arrow")
+
+def write_sales_columnar(shop_id: str, start_date: date, end_date: date, out, fmt: str,
+                         product_id: Optional[str] = None, replica: bool = False,
+                         batch_rows: int = EXPORT_BATCH_ROWS) -> int:
+    """
+    Stream the sales report into a Parquet or Arrow IPC file, one row group or
+    record batch per chunk. Returns the number of rows written.
+    """
+    writer = _batch_writer(out, fmt, SALES_SCHEMA)
+    rows = 0
+    try:
+        for batch in sales_record_batches(shop_id, start_date, end_date, product_id, replica, batch_rows):
+            writer.write_batch(batch)
+            rows += batch.num_rows
+    finally:
+        writer.close()
+    return rows
+
+def write_sales_export(shop_id: str, start_date: date, end_date: date, out, fmt: str = 'csv',
+                       product_id: Optional[str] = None, replica: bool = False):
+    """Write the sales report for a date range into a binary file object in any EXPORT_FORMATS format."""
+    if fmt == 'csv':
+        copy_sales_csv(shop_id, start_date, end_date, out, product_id, replica)
+    else:
+        write_sales_columnar(shop_id, start_date, end_date, out, fmt, product_id, replica)
+
+def write_frame(df: pd.DataFrame, path: str, schema: pa.Schema, fmt: str = 'csv'):
+    """
+    Write an in-memory report frame (trend, products, totals) as CSV, Parquet
+    or Arrow IPC with schema's columns, so every file has the same types
+    whatever its rows.
+    """
+    if fmt == 'csv':
+        df.to_csv(path, columns=schema.names, index=False, date_format='%Y-%m-%d')
+        return
+    # Empty aggregate frames carry placeholder float columns that cannot be cast
+    if df.empty:
+        table = schema.empty_table()
+    else:
+        table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    writer = _batch_writer(path, fmt, schema)
+    try:
+        writer.write_table(table)
+    finally:
+        writer.close()
+
+def spooled_sales_export(shop_id: str, start_date: date, end_date: date, product_id: Optional[str] = None,
+                         fmt: str = 'csv', replica: bool = False):
+    """
+    Return the export as a rewound temporary file.
+    Small exports stay in memory; large ones are spooled to disk.
+    A failed replica export is started again on the primary.
+    """
+    out = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES, mode='w+b')
+    try:
+        try:
+            write_sales_export(shop_id, start_date, end_date, out, fmt, product_id, replica)
+        except REPLICA_FALLBACK_ERRORS:
+            if not replica:
+                raise
+            out.seek(0)
+            out.truncate()
+            write_sales_export(shop_id, start_date, end_date, out, fmt, product_id)
+    except Exception:
+        out.close()
+        raise
+    out.seek(0)
+    return out
+
+def export_sales(shop_id: str, start_date: date, end_date: date, path: str,
+                 product_id: Optional[str] = None, fmt: str = 'csv') -> bool:
+    """Export the sales report for a date range to a CSV, Parquet or Arrow IPC file on disk."""
+    if not os.getenv("DATABASE_URL"):
+        print("ERROR: DATABASE_URL environment variable is not set!")
+        return False
+    
+    try:
+        print("Connecting to NeonDB PostgreSQL...")
+        print(f"Exporting sales from {start_date} to {end_date} to {path}...")
+        with open(path, 'wb') as out:
+            write_sales_export(shop_id, start_date, end_date, out, fmt, product_id)
+        
+        print(f"✅ Wrote {os.path.getsize(path):,} bytes!")
+        return True
+    
+    except Exception as e:
+        print(f"ERROR: Failed to export sales: {e}")
+        return False
+
+def format_for_path(path: str) -> str:
+    """Export format implied by a file extension, defaulting to CSV."""
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension in EXPORT_FORMATS:
+        return extension
+    # Arrow IPC files are also known by their older Feather name
+    return 'arrow' if extension in ('feather', 'ipc') else 'csv'
+
+def parse_date(value: str) -> date:
+    """Parse a YYYY-MM-DD command line date."""
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a shop's sales report to CSV, Parquet or Arrow IPC.")
+    parser.add_argument("--shop-id", required=True, help="Shop to export")
+    parser.add_argument("--start", type=parse_date, required=True, help="First day (YYYY-MM-DD)")
+    parser.add_argument("--end", type=parse_date, required=True, help="Last day (YYYY-MM-DD)")
+    parser.add_argument("--product-id", help="Only export this product")
+    parser.add_argument("--out", required=True, help="File to write")
+    parser.add_argument("--format", choices=list(EXPORT_FORMATS),
+                        help="Output format (defaults to the --out extension, else csv)")
+    args = parser.parse_args()
+    
+    print("📥 Exporting Pima Sales Report...")
+    print("=" * 50)
+    
+    success = export_sales(args.shop_id, args.start, args.end, args.out, args.product_id,
+                           args.format or format_for_path(args.out))
+    
+    if success:
+        print("\n" + "=" * 50)
+        print("🎉 Export completed!")
+    else:
+        print("\n❌ Export failed!")
+        print("Please check the error messages above and try again.")
+        raise SystemExit(1)
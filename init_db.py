@@ -1,18 +1,140 @@
 #!/usr/bin/env python3
 """
 Database initialization script for Pima app with NeonDB PostgreSQL
-Run this script to create the database schema.
+Run this script to create the database schema and apply any pending
+migrations from the migrations/ directory. It is safe to re-run against
+an existing deployment.
 """
 
 import os
+import re
 import psycopg2
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+
+# Migrations starting with this marker run statement by statement in autocommit
+# mode, which CREATE INDEX CONCURRENTLY requires
+NO_TRANSACTION_MARKER = '-- migrate:no-transaction'
+
+# Arbitrary key so two deploys never apply migrations at the same time
+MIGRATION_LOCK_KEY = 7461626
+
+def discover_migrations() -> list:
+    """Return (version, name, path) for every migration file, in version order."""
+    migrations = []
+    if not os.path.isdir(MIGRATIONS_DIR):
+        return migrations
+    
+    for filename in os.listdir(MIGRATIONS_DIR):
+        match = re.match(r"^(\d+)_(\w+)\.sql$", filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(MIGRATIONS_DIR, filename)))
+    
+    return sorted(migrations)
+
+def split_sql_statements(sql: str) -> list:
+    """
+    Split a migration into individual statements.
+    Semicolons inside $$ blocks and comments do not end a statement.
+    """
+    statements = []
+    current = []
+    in_dollar_quote = False
+    
+    for line in sql.splitlines():
+        stripped = line.strip()
+        if not current and (not stripped or stripped.startswith('--')):
+            continue
+        
+        current.append(line)
+        if stripped.count('$$') % 2 == 1:
+            in_dollar_quote = not in_dollar_quote
+        
+        if not in_dollar_quote and stripped.endswith(';'):
+            statements.append('\n'.join(current))
+            current = []
+    
+    if current and '\n'.join(current).strip():
+        statements.append('\n'.join(current))
+    
+    return statements
+
+def drop_invalid_indexes(conn, sql: str):
+    """Drop indexes left INVALID by an interrupted CREATE INDEX CONCURRENTLY in this migration."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relname
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE NOT i.indisvalid
+            """
+        )
+        for (index_name,) in cur.fetchall():
+            if re.search(rf"\b{re.escape(index_name)}\b", sql):
+                print(f"   Dropping invalid index {index_name} from an earlier attempt...")
+                cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{index_name}"')
+
+def apply_migration(conn, version: int, name: str, sql: str):
+    """Apply a single migration and record it in schema_migrations."""
+    if sql.lstrip().startswith(NO_TRANSACTION_MARKER):
+        conn.autocommit = True
+        try:
+            drop_invalid_indexes(conn, sql)
+            with conn.cursor() as cur:
+                for statement in split_sql_statements(sql):
+                    cur.execute(statement)
+                cur.execute(
+                    "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                    (version, name)
+                )
+        finally:
+            conn.autocommit = False
+    else:
+        with conn.cursor() as cur:
+            cur.execute(sql)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (version, name)
+            )
+        conn.commit()
+
+def apply_migrations(conn) -> int:
+    """Apply all pending migrations in order. Returns the number applied."""
+    applied_count = 0
+    
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_KEY,))
+    conn.commit()
+    
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT version FROM schema_migrations")
+            applied = {row[0] for row in cur.fetchall()}
+        conn.commit()
+        
+        for version, name, path in discover_migrations():
+            if version in applied:
+                continue
+            
+            print(f"Applying migration {version:04d}_{name}...")
+            with open(path, 'r') as f:
+                apply_migration(conn, version, name, f.read())
+            applied_count += 1
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_KEY,))
+        conn.commit()
+    
+    return applied_count
+
 def init_database():
-    """Initialize the database with the schema."""
+    """Initialize the database with the schema and pending migrations."""
     database_url = os.getenv("DATABASE_URL")
     
     if not database_url:
@@ -35,6 +157,11 @@ def init_database():
             cur.execute(schema_sql)
             conn.commit()
         
+        # Apply migrations
+        print("Applying migrations...")
+        applied_count = apply_migrations(conn)
+        print(f"✅ {applied_count} migration(s) applied.")
+        
         print("✅ Database schema created successfully!")
         print("✅ Your Pima app is ready to use with NeonDB PostgreSQL!")
         
@@ -64,4 +191,4 @@ if __name__ == "__main__":
         print("3. Run the app: streamlit run app.py --server.port 8502")
     else:
         print("\n❌ Database initialization failed!")
-        print("Please check the error messages above and try again.")
\ No newline at end of file
+        print("Please check the error messages above and try again.")
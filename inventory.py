@@ -0,0 +1,101 @@
+"""
+Inventory balances for Pima app.
+
+inventory_balances keeps one row per product with the running totals of
+stock received and units sold, so the on-hand quantity is a single lookup
+instead of summing the stock and sales history. Every write path adds to it
+in the same transaction as the rows it records, and rebuild_inventory.py
+can regenerate it from history.
+"""
+
+import os
+from typing import Optional
+
+import pandas as pd
+from psycopg2.extras import execute_values
+
+from db import execute_query, fetch_frame
+
+# Products at or below this many units are flagged, unless they set their own threshold
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "5"))
+
+INVENTORY_COLUMNS = ['product_id', 'name', 'stock_in', 'sold', 'on_hand', 'low_stock_threshold', 'low_stock']
+
+# Adds incoming movements onto the existing balance; thresholds are left alone
+BALANCE_CONFLICT_SQL = """
+    ON CONFLICT (shop_id, product_id) DO UPDATE SET
+        stock_in = b.stock_in + EXCLUDED.stock_in,
+        sold = b.sold + EXCLUDED.sold,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+# Apply a batch of (shop_id, product_id, stock_in, sold) movements, expanded
+# by execute_values. Grouped first because one upsert cannot touch a row twice.
+APPLY_MOVEMENTS_SQL = """
+    INSERT INTO inventory_balances AS b (shop_id, product_id, stock_in, sold)
+    SELECT v.shop_id::uuid, v.product_id::uuid, SUM(v.stock_in), SUM(v.sold)
+    FROM (VALUES %s) AS v (shop_id, product_id, stock_in, sold)
+    GROUP BY v.shop_id, v.product_id
+""" + BALANCE_CONFLICT_SQL
+
+# Recompute balances from the stock and sales history; the shop filter is optional.
+# The lock makes concurrent writes wait rather than be counted twice or lost.
+REBUILD_BALANCES_SQL = """
+    LOCK TABLE inventory_balances IN SHARE ROW EXCLUSIVE MODE;
+    INSERT INTO inventory_balances AS b (shop_id, product_id, stock_in, sold)
+    SELECT p.shop_id, p.id, COALESCE(st.quantity, 0), COALESCE(s.quantity, 0)
+    FROM products p
+    LEFT JOIN (
+        SELECT product_id, SUM(quantity) AS quantity FROM stock
+        WHERE (%(shop_id)s::uuid IS NULL OR shop_id = %(shop_id)s::uuid)
+        GROUP BY product_id
+    ) st ON st.product_id = p.id
+    LEFT JOIN (
+        SELECT product_id, SUM(quantity) AS quantity FROM sales
+        WHERE (%(shop_id)s::uuid IS NULL OR shop_id = %(shop_id)s::uuid)
+        GROUP BY product_id
+    ) s ON s.product_id = p.id
+    WHERE (%(shop_id)s::uuid IS NULL OR p.shop_id = %(shop_id)s::uuid)
+    ON CONFLICT (shop_id, product_id) DO UPDATE SET
+        stock_in = EXCLUDED.stock_in,
+        sold = EXCLUDED.sold,
+        updated_at = CURRENT_TIMESTAMP;
+"""
+
+INVENTORY_SQL = """
+    SELECT b.product_id, p.name, b.stock_in, b.sold, b.on_hand,
+           COALESCE(b.low_stock_threshold, %s) AS low_stock_threshold,
+           b.on_hand <= COALESCE(b.low_stock_threshold, %s) AS low_stock
+    FROM inventory_balances b
+    JOIN products p ON p.id = b.product_id
+    WHERE b.shop_id = %s
+    ORDER BY b.on_hand <= COALESCE(b.low_stock_threshold, %s) DESC, b.on_hand, p.name
+"""
+
+
+def apply_movements(cur, movements: list):
+    """Add (shop_id, product_id, stock_in, sold) movements using an open transaction's cursor."""
+    if movements:
+        execute_values(cur, APPLY_MOVEMENTS_SQL, movements, page_size=len(movements))
+
+
+def get_inventory(shop_id: str, replica: bool = False) -> pd.DataFrame:
+    """Current on-hand quantity and low-stock flag for every product in a shop."""
+    threshold = LOW_STOCK_THRESHOLD
+    df = fetch_frame(INVENTORY_SQL, (threshold, threshold, shop_id, threshold), replica=replica)
+    df = df.reindex(columns=INVENTORY_COLUMNS)
+    df['low_stock'] = df['low_stock'].astype(bool)
+    return df
+
+
+def set_low_stock_threshold(shop_id: str, product_id: str, threshold: Optional[int]) -> bool:
+    """Set a product's low-stock threshold; None falls back to LOW_STOCK_THRESHOLD."""
+    return execute_query(
+        "UPDATE inventory_balances SET low_stock_threshold = %s WHERE shop_id = %s AND product_id = %s",
+        (threshold, shop_id, product_id)
+    ) > 0
+
+
+def rebuild_balances(shop_id: Optional[str] = None) -> int:
+    """Regenerate balances from the stock and sales history. Returns rows written."""
+    return execute_query(REBUILD_BALANCES_SQL, {'shop_id': shop_id})
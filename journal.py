@@ -0,0 +1,331 @@
+"""
+Local write-ahead journal for Pima app.
+
+Sales and stock updates are appended to a SQLite journal on local disk and
+acknowledged as soon as that commit is durable, so the till never waits on
+(or loses a sale to) a slow or unreachable database. A background thread
+ships pending entries to PostgreSQL in batches. Every entry carries an
+idempotency key that is stored in write_receipts in the same transaction as
+the write, so an entry sent twice (after a crash, a lost commit reply, or by
+a second app process sharing the journal) is applied exactly once.
+
+Entries that keep failing for reasons other than connectivity are parked as
+failed after JOURNAL_MAX_ATTEMPTS and left in the journal for a retry.
+
+The journal is off unless WRITE_JOURNAL_PATH is set; writes then go straight
+to the database. Queued sales live only in that file until flushed, so point
+it at persistent disk that survives restarts and redeploys, never at an
+ephemeral container filesystem.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date
+from typing import Callable, List, Optional
+
+from psycopg2.extras import execute_values
+
+from db import CONNECTION_ERRORS, PoolTimeout, execute_query, transaction
+from inventory import apply_movements
+from metrics import metrics
+from partitions import ensure_partitions
+from reports import RECORD_SALES_SQL
+
+JOURNAL_PATH = os.getenv("WRITE_JOURNAL_PATH", "")
+JOURNAL_BATCH_SIZE = int(os.getenv("JOURNAL_BATCH_SIZE", "200"))
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_INTERVAL", "1"))
+JOURNAL_MAX_ATTEMPTS = int(os.getenv("JOURNAL_MAX_ATTEMPTS", "10"))
+# Receipts only need to outlive any entry that could still be resent
+RECEIPT_RETENTION_DAYS = int(os.getenv("JOURNAL_RECEIPT_DAYS", "30"))
+
+# Errors that mean the database is unreachable; the batch is simply retried later
+UNAVAILABLE_ERRORS = CONNECTION_ERRORS + (PoolTimeout,)
+
+JOURNAL_KINDS = ('sales', 'stock')
+
+logger = logging.getLogger('pima.journal')
+
+JOURNAL_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS pending_writes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        idempotency_key TEXT NOT NULL UNIQUE,
+        kind TEXT NOT NULL,
+        shop_id TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        failed INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_pending_writes_shop ON pending_writes (shop_id, failed);
+"""
+
+# Claim a batch's keys; only keys not seen before come back, and only those entries are applied
+RECEIPTS_SQL = """
+    INSERT INTO write_receipts (idempotency_key, shop_id)
+    VALUES %s
+    ON CONFLICT (idempotency_key) DO NOTHING
+    RETURNING idempotency_key
+"""
+
+STOCK_SQL = "INSERT INTO stock (shop_id, product_id, quantity, date) VALUES %s"
+
+
+class WriteJournal:
+    """SQLite-backed queue of sales and stock writes with a background flusher."""
+
+    def __init__(self, path: str, batch_size: int = 200, flush_interval: float = 1.0,
+                 max_attempts: int = 10):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+
+        self._conn = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._on_applied = None
+        self._receipts_pruned_at = 0.0
+        self._stats = {'appended': 0, 'applied': 0, 'duplicates': 0, 'batches': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def _db(self) -> sqlite3.Connection:
+        """Open the journal on first use. Caller holds the lock."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            # WAL keeps appends cheap; FULL syncs each commit so an acknowledged write survives power loss
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.executescript(JOURNAL_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def append(self, kind: str, shop_id: str, day: date, lines: list) -> str:
+        """
+        Durably queue (product_id, quantity) lines of one sale or stock update.
+        Returns the entry's idempotency key.
+        """
+        if kind not in JOURNAL_KINDS:
+            raise ValueError(f"Unknown journal kind '{kind}'; expected one of {', '.join(JOURNAL_KINDS)}")
+
+        key = str(uuid.uuid4())
+        payload = json.dumps({
+            'date': day.isoformat(),
+            'lines': [[str(product_id), int(quantity)] for product_id, quantity in lines],
+        })
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.execute(
+                    "INSERT INTO pending_writes (idempotency_key, kind, shop_id, payload, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, kind, str(shop_id), payload, time.time())
+                )
+            self._stats['appended'] += 1
+        self._wake.set()
+        return key
+
+    def pending_count(self, shop_id: Optional[str] = None, failed: bool = False) -> int:
+        """Entries still waiting to be applied (or parked as failed), optionally for one shop."""
+        if not self.enabled:
+            return 0
+        query = "SELECT COUNT(*) FROM pending_writes WHERE failed = ?"
+        params = [int(failed)]
+        if shop_id is not None:
+            query += " AND shop_id = ?"
+            params.append(str(shop_id))
+        with self._lock:
+            return self._db().execute(query, params).fetchone()[0]
+
+    def failed_entries(self, shop_id: str) -> List[dict]:
+        """A shop's parked entries with the last error, oldest first."""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT kind, payload, created_at, last_error FROM pending_writes "
+                "WHERE shop_id = ? AND failed = 1 ORDER BY seq",
+                (str(shop_id),)
+            ).fetchall()
+        return [
+            {'kind': kind, **json.loads(payload), 'created_at': created_at, 'error': last_error}
+            for kind, payload, created_at, last_error in rows
+        ]
+
+    def retry_failed(self, shop_id: str) -> int:
+        """Put a shop's parked entries back in the queue. Returns how many."""
+        with self._lock:
+            conn = self._db()
+            with conn:
+                count = conn.execute(
+                    "UPDATE pending_writes SET failed = 0, attempts = 0 WHERE shop_id = ? AND failed = 1",
+                    (str(shop_id),)
+                ).rowcount
+        self._wake.set()
+        return count
+
+    def _next_batch(self) -> list:
+        """Oldest pending entries as (seq, key, kind, shop_id, day, lines)."""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT seq, idempotency_key, kind, shop_id, payload FROM pending_writes "
+                "WHERE failed = 0 ORDER BY seq LIMIT ?",
+                (self.batch_size,)
+            ).fetchall()
+        batch = []
+        for seq, key, kind, shop_id, payload in rows:
+            payload = json.loads(payload)
+            batch.append((seq, key, kind, shop_id, date.fromisoformat(payload['date']), payload['lines']))
+        return batch
+
+    def _apply(self, batch: list):
+        """Apply a batch to PostgreSQL in one transaction, skipping keys already applied."""
+        for kind in JOURNAL_KINDS:
+            ensure_partitions(kind, {day for _, _, entry_kind, _, day, _ in batch if entry_kind == kind})
+
+        with transaction() as cur:
+            receipts = [(key, shop_id) for _, key, _, shop_id, _, _ in batch]
+            claimed = execute_values(cur, RECEIPTS_SQL, receipts, page_size=len(receipts), fetch=True)
+            new_keys = {str(row[0]) for row in claimed}
+
+            sales, stock, movements = [], [], []
+            for _, key, kind, shop_id, day, lines in batch:
+                if key not in new_keys:
+                    continue
+                for product_id, quantity in lines:
+                    if kind == 'sales':
+                        sales.append((shop_id, product_id, quantity, day))
+                        movements.append((shop_id, product_id, 0, quantity))
+                    else:
+                        stock.append((shop_id, product_id, quantity, day))
+                        movements.append((shop_id, product_id, quantity, 0))
+
+            if sales:
+                execute_values(cur, RECORD_SALES_SQL, sales, page_size=len(sales))
+            if stock:
+                execute_values(cur, STOCK_SQL, stock, page_size=len(stock))
+            apply_movements(cur, movements)
+
+        with self._lock:
+            self._stats['duplicates'] += len(batch) - len(new_keys)
+
+    def _applied(self, batch: list):
+        """Drop applied entries from the journal and tell the app which shops changed."""
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.executemany("DELETE FROM pending_writes WHERE seq = ?", [(entry[0],) for entry in batch])
+            self._stats['applied'] += len(batch)
+            self._stats['batches'] += 1
+        if self._on_applied is not None:
+            for shop_id in {entry[3] for entry in batch}:
+                self._on_applied(shop_id)
+
+    def _record_failure(self, entry: tuple, error: Exception):
+        """Count a failed attempt, parking the entry once it has used up its attempts."""
+        with self._lock:
+            conn = self._db()
+            with conn:
+                conn.execute(
+                    "UPDATE pending_writes SET attempts = attempts + 1, last_error = ?, "
+                    "failed = CASE WHEN attempts + 1 >= ? THEN 1 ELSE 0 END WHERE seq = ?",
+                    (_first_line(error), self.max_attempts, entry[0])
+                )
+        logger.warning("Journaled %s write %s failed: %s", entry[2], entry[1], error)
+
+    def flush(self) -> int:
+        """
+        Apply one batch of pending entries. Returns how many were applied.
+        Raises UNAVAILABLE_ERRORS when the database cannot be reached.
+        """
+        batch = self._next_batch()
+        if not batch:
+            return 0
+
+        try:
+            self._apply(batch)
+            self._applied(batch)
+            return len(batch)
+        except UNAVAILABLE_ERRORS:
+            raise
+        except Exception as e:
+            if len(batch) == 1:
+                self._record_failure(batch[0], e)
+                return 0
+
+        # Something in the batch is bad; apply entries one by one to isolate it
+        applied = 0
+        for entry in batch:
+            try:
+                self._apply([entry])
+                self._applied([entry])
+                applied += 1
+            except UNAVAILABLE_ERRORS:
+                raise
+            except Exception as e:
+                self._record_failure(entry, e)
+        return applied
+
+    def _prune_receipts(self):
+        """Delete receipts old enough that no journal entry can still be resent, at most hourly."""
+        if time.monotonic() - self._receipts_pruned_at < 3600:
+            return
+        execute_query(
+            "DELETE FROM write_receipts WHERE applied_at < CURRENT_TIMESTAMP - make_interval(days => %s)",
+            (RECEIPT_RETENTION_DAYS,)
+        )
+        self._receipts_pruned_at = time.monotonic()
+
+    def _run(self):
+        """Flusher loop: drain the journal whenever woken, backing off while the database is down."""
+        backoff = self.flush_interval
+        while True:
+            self._wake.wait(backoff)
+            self._wake.clear()
+            try:
+                while self.flush() == self.batch_size:
+                    pass
+                self._prune_receipts()
+                backoff = self.flush_interval
+            except UNAVAILABLE_ERRORS as e:
+                backoff = min(max(backoff, self.flush_interval) * 2, 30.0)
+                logger.warning("Database unavailable, retrying journal flush in %.0fs: %s", backoff, e)
+            except Exception:
+                logger.exception("Journal flush failed")
+
+    def start(self, on_applied: Optional[Callable[[str], None]] = None):
+        """Start the background flusher once per process; on_applied(shop_id) runs after each applied batch."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._on_applied = on_applied
+            self._thread = threading.Thread(target=self._run, name='pima-journal', daemon=True)
+            self._thread.start()
+
+    def stats(self) -> dict:
+        """Return a snapshot of journal counters."""
+        with self._lock:
+            return dict(self._stats)
+
+
+def _first_line(error: Exception) -> str:
+    """Short error text for the UI (psycopg2 appends DETAIL lines)."""
+    text = str(error).strip() or type(error).__name__
+    return text.splitlines()[0]
+
+
+write_journal = WriteJournal(JOURNAL_PATH, JOURNAL_BATCH_SIZE, JOURNAL_FLUSH_INTERVAL, JOURNAL_MAX_ATTEMPTS)
+
+metrics.register_gauge('pima_journal_pending', 'Journaled writes waiting to be applied to the database.',
+                       lambda: write_journal.pending_count())
+metrics.register_gauge('pima_journal_failed', 'Journaled writes parked after repeated failures.',
+                       lambda: write_journal.pending_count(failed=True))
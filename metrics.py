@@ -0,0 +1,282 @@
+"""
+Query and page-render instrumentation for Pima app.
+
+db.py reports every query here with its connect (pool checkout), execute and
+fetch times, and app.py reports how long each page took to render. Counters
+are exported in Prometheus text format, either to METRICS_FILE or over HTTP
+on METRICS_PORT. Queries slower than SLOW_QUERY_MS are logged to the
+'pima.slow_queries' logger (and to SLOW_QUERY_LOG_FILE when set).
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Optional
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "500"))
+METRICS_FILE = os.getenv("METRICS_FILE")
+METRICS_FILE_INTERVAL = float(os.getenv("METRICS_FILE_INTERVAL", "10"))
+METRICS_PORT = os.getenv("METRICS_PORT")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Histogram bucket upper bounds, in seconds
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+QUERY_PHASES = ('connect', 'execute', 'fetch')
+
+slow_query_logger = logging.getLogger('pima.slow_queries')
+if os.getenv("SLOW_QUERY_LOG_FILE"):
+    _handler = logging.FileHandler(os.getenv("SLOW_QUERY_LOG_FILE"))
+    _handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    slow_query_logger.addHandler(_handler)
+    slow_query_logger.setLevel(logging.WARNING)
+
+
+def normalize_sql(query: str, max_length: int = 200) -> str:
+    """Collapse whitespace and replace literals so similar queries share one label."""
+    query = re.sub(r"'(?:[^']|'')*'", '?', query)
+    query = re.sub(r"\b\d+(?:\.\d+)?\b", '?', query)
+    query = re.sub(r"\s+", ' ', query).strip()
+    return query if len(query) <= max_length else query[:max_length - 3] + '...'
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets: tuple = DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Metrics:
+    """Thread-safe registry for query and page timings."""
+
+    def __init__(self, slow_query_ms: float = SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._queries = {}  # normalized sql -> {'count', 'rows', 'connect', 'execute', 'fetch'}
+        self._query_duration = Histogram()
+        self._slow_queries = 0
+        self._pages = {}  # page -> Histogram
+        self._gauges = {}  # name -> (help, callable returning a number)
+        self._counters = {}  # name -> (help, {labels: value})
+        self._histograms = {}  # name -> (help, {labels: Histogram})
+        self._hooks = []
+
+    def add_query_hook(self, hook: Callable[[dict], None]):
+        """Register a callable that receives every query timing record."""
+        self._hooks.append(hook)
+
+    def register_gauge(self, name: str, help_text: str, func: Callable[[], float]):
+        """Export the value returned by func as a gauge."""
+        self._gauges[name] = (help_text, func)
+
+    def increment(self, name: str, help_text: str, amount: float = 1, labels: str = ''):
+        """Add to a named counter."""
+        with self._lock:
+            values = self._counters.setdefault(name, (help_text, {}))[1]
+            values[labels] = values.get(labels, 0) + amount
+
+    def observe(self, name: str, help_text: str, seconds: float, labels: str = ''):
+        """Record a duration in a named histogram."""
+        with self._lock:
+            series = self._histograms.setdefault(name, (help_text, {}))[1]
+            series.setdefault(labels, Histogram()).observe(seconds)
+
+    def record_query(self, query: str, connect_s: float, execute_s: float, fetch_s: float, rows: int):
+        """Record one query's phase timings and row count."""
+        sql = normalize_sql(query)
+        total_s = connect_s + execute_s + fetch_s
+        record = {
+            'sql': sql, 'connect_s': connect_s, 'execute_s': execute_s,
+            'fetch_s': fetch_s, 'total_s': total_s, 'rows': rows,
+        }
+
+        with self._lock:
+            stats = self._queries.setdefault(
+                sql, {'count': 0, 'rows': 0, 'connect': 0.0, 'execute': 0.0, 'fetch': 0.0}
+            )
+            stats['count'] += 1
+            stats['rows'] += rows
+            stats['connect'] += connect_s
+            stats['execute'] += execute_s
+            stats['fetch'] += fetch_s
+            self._query_duration.observe(total_s)
+            is_slow = total_s * 1000 >= self.slow_query_ms
+            if is_slow:
+                self._slow_queries += 1
+
+        if is_slow:
+            slow_query_logger.warning(
+                "slow query %.1f ms (connect %.1f, execute %.1f, fetch %.1f) rows=%d: %s",
+                total_s * 1000, connect_s * 1000, execute_s * 1000, fetch_s * 1000, rows, sql
+            )
+
+        for hook in self._hooks:
+            hook(record)
+
+    def record_page(self, page: str, seconds: float):
+        """Record how long a page took to render."""
+        with self._lock:
+            self._pages.setdefault(page, Histogram()).observe(seconds)
+
+    @contextmanager
+    def page_timer(self, page: str):
+        """Time the enclosed block as one render of page."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_page(page, time.perf_counter() - started)
+            maybe_write_metrics_file()
+
+    def render_prometheus(self) -> str:
+        """Render all metrics in Prometheus text exposition format."""
+        lines = []
+
+        def header(name: str, metric_type: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+
+        def histogram(name: str, hist: Histogram, labels: str = ''):
+            prefix = f"{labels}," if labels else ''
+            for bound, count in zip(hist.buckets, hist.counts):
+                lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {hist.count}')
+            suffix = f"{{{labels}}}" if labels else ''
+            lines.append(f"{name}_sum{suffix} {hist.sum:.6f}")
+            lines.append(f"{name}_count{suffix} {hist.count}")
+
+        with self._lock:
+            header('pima_db_queries_total', 'counter', 'Queries executed, by normalized SQL.')
+            for sql, stats in self._queries.items():
+                lines.append(f'pima_db_queries_total{{query="{_escape(sql)}"}} {stats["count"]}')
+
+            header('pima_db_query_rows_total', 'counter', 'Rows fetched or affected, by normalized SQL.')
+            for sql, stats in self._queries.items():
+                lines.append(f'pima_db_query_rows_total{{query="{_escape(sql)}"}} {stats["rows"]}')
+
+            header('pima_db_query_phase_seconds_total', 'counter',
+                   'Time spent per query phase (connect = pool checkout), by normalized SQL.')
+            for sql, stats in self._queries.items():
+                for phase in QUERY_PHASES:
+                    lines.append(
+                        f'pima_db_query_phase_seconds_total{{query="{_escape(sql)}",phase="{phase}"}} {stats[phase]:.6f}'
+                    )
+
+            header('pima_db_query_duration_seconds', 'histogram', 'End-to-end query duration.')
+            histogram('pima_db_query_duration_seconds', self._query_duration)
+
+            header('pima_db_slow_queries_total', 'counter', f'Queries slower than {self.slow_query_ms:g} ms.')
+            lines.append(f"pima_db_slow_queries_total {self._slow_queries}")
+
+            header('pima_page_render_duration_seconds', 'histogram', 'Page render time, by page.')
+            for page, hist in self._pages.items():
+                histogram('pima_page_render_duration_seconds', hist, f'page="{_escape(page)}"')
+
+            for name, (help_text, values) in self._counters.items():
+                header(name, 'counter', help_text)
+                for labels, value in values.items():
+                    suffix = f"{{{labels}}}" if labels else ''
+                    lines.append(f"{name}{suffix} {value:g}")
+
+            for name, (help_text, series) in self._histograms.items():
+                header(name, 'histogram', help_text)
+                for labels, hist in series.items():
+                    histogram(name, hist, labels)
+
+            gauges = list(self._gauges.items())
+
+        for name, (help_text, func) in gauges:
+            try:
+                value = float(func())
+            except Exception:
+                continue
+            header(name, 'gauge', help_text)
+            lines.append(f"{name} {value:g}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Process-wide registry shared by all sessions
+metrics = Metrics()
+
+_last_file_write = 0.0
+_file_lock = threading.Lock()
+
+
+def write_metrics_file(path: str):
+    """Atomically write the current metrics to path."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(metrics.render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def maybe_write_metrics_file():
+    """Write METRICS_FILE if configured and the write interval has passed."""
+    global _last_file_write
+    if not METRICS_FILE:
+        return
+    with _file_lock:
+        now = time.monotonic()
+        if now - _last_file_write < METRICS_FILE_INTERVAL:
+            return
+        _last_file_write = now
+    try:
+        write_metrics_file(METRICS_FILE)
+    except OSError as e:
+        logging.getLogger('pima.metrics').warning("Could not write metrics file %s: %s", METRICS_FILE, e)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Serves /metrics for Prometheus scrapes."""
+
+    def do_GET(self):
+        if self.path.rstrip('/') != '/metrics':
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: Optional[int] = None) -> Optional[ThreadingHTTPServer]:
+    """Start the /metrics endpoint once per process if METRICS_PORT (or port) is set."""
+    global _server
+    port = port or (int(METRICS_PORT) if METRICS_PORT else None)
+    if not port:
+        return None
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((METRICS_HOST, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name='pima-metrics', daemon=True).start()
+    return _server
@@ -0,0 +1,20 @@
+-- migrate:no-transaction
+-- Composite and covering indexes matched to the query shapes in app.py.
+-- Built CONCURRENTLY so live shops keep writing while the indexes build.
+
+-- get_sales_report: shop_id + date range, ordered by date, created_at
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sales_shop_date_created
+    ON sales (shop_id, date DESC, created_at DESC) INCLUDE (product_id, quantity);
+
+-- get_products: shop_id, ordered by created_at; covers the selected columns
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_products_shop_created
+    ON products (shop_id, created_at DESC) INCLUDE (id, name, buying_price, selling_price);
+
+-- Stock history per product within a shop
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_stock_shop_product_date
+    ON stock (shop_id, product_id, date);
+
+-- Single-column shop_id indexes are now prefixes of the composites above
+DROP INDEX CONCURRENTLY IF EXISTS idx_sales_shop_id;
+DROP INDEX CONCURRENTLY IF EXISTS idx_products_shop_id;
+DROP INDEX CONCURRENTLY IF EXISTS idx_stock_shop_id;
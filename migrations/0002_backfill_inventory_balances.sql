@@ -0,0 +1,14 @@
+-- Backfill inventory_balances from the existing stock and sales history.
+-- Same computation as inventory.REBUILD_BALANCES_SQL for all shops.
+
+LOCK TABLE inventory_balances IN SHARE ROW EXCLUSIVE MODE;
+
+INSERT INTO inventory_balances AS b (shop_id, product_id, stock_in, sold)
+SELECT p.shop_id, p.id, COALESCE(st.quantity, 0), COALESCE(s.quantity, 0)
+FROM products p
+LEFT JOIN (SELECT product_id, SUM(quantity) AS quantity FROM stock GROUP BY product_id) st ON st.product_id = p.id
+LEFT JOIN (SELECT product_id, SUM(quantity) AS quantity FROM sales GROUP BY product_id) s ON s.product_id = p.id
+ON CONFLICT (shop_id, product_id) DO UPDATE SET
+    stock_in = EXCLUDED.stock_in,
+    sold = EXCLUDED.sold,
+    updated_at = CURRENT_TIMESTAMP;
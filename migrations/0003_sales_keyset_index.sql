@@ -0,0 +1,9 @@
+-- migrate:no-transaction
+-- The View Reports detail table pages through sales by (date, created_at, id).
+-- Adding id to the composite index makes the keyset order fully indexed;
+-- the old index is a prefix of the new one and is dropped.
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_sales_shop_date_created_id
+    ON sales (shop_id, date DESC, created_at DESC, id DESC) INCLUDE (product_id, quantity);
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_sales_shop_date_created;
@@ -0,0 +1,17 @@
+-- Snapshot unit prices onto each sale so profit no longer follows later
+-- product price edits, and reports can aggregate sales without products.
+-- Existing rows are backfilled with the product prices as they are now,
+-- which is what every report showed for them until this migration.
+
+ALTER TABLE sales ADD COLUMN IF NOT EXISTS buying_price DECIMAL(10,2);
+ALTER TABLE sales ADD COLUMN IF NOT EXISTS selling_price DECIMAL(10,2);
+
+UPDATE sales s
+SET buying_price = p.buying_price,
+    selling_price = p.selling_price
+FROM products p
+WHERE p.id = s.product_id
+  AND (s.buying_price IS NULL OR s.selling_price IS NULL);
+
+ALTER TABLE sales ALTER COLUMN buying_price SET NOT NULL;
+ALTER TABLE sales ALTER COLUMN selling_price SET NOT NULL;
@@ -0,0 +1,116 @@
+-- Convert sales and stock into tables range-partitioned by month on date.
+-- Date-bounded queries then scan only the months they touch, and old months
+-- can be detached (see partitions.py) instead of deleted row by row.
+--
+-- Each table is rebuilt in this transaction: the heap table is renamed,
+-- monthly partitions are created from its first month to three months ahead,
+-- rows are copied across and the old table is dropped. Writes to sales and
+-- stock wait until the migration commits.
+-- Primary keys include date, as every unique key on a partitioned table must.
+
+-- Create the partition of a parent table for the month containing for_date,
+-- named <parent>_yYYYYmMM, unless it already exists. Months that were
+-- detached for archiving are not recreated.
+CREATE OR REPLACE FUNCTION ensure_monthly_partition(parent TEXT, for_date DATE)
+RETURNS TEXT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', for_date)::date;
+    partition_name TEXT := format('%s_y%sm%s', parent, to_char(month_start, 'YYYY'), to_char(month_start, 'MM'));
+BEGIN
+    IF to_regclass(partition_name) IS NULL THEN
+        -- Serialize concurrent callers creating the same month
+        PERFORM pg_advisory_xact_lock(hashtext(partition_name));
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, parent, month_start, (month_start + INTERVAL '1 month')::date
+            );
+            RETURN partition_name;
+        END IF;
+    END IF;
+
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_inherits
+        WHERE inhrelid = to_regclass(partition_name) AND inhparent = to_regclass(parent)
+    ) THEN
+        RAISE EXCEPTION '% for % has been detached; reattach it to write to that month',
+            partition_name, to_char(month_start, 'YYYY-MM');
+    END IF;
+    RETURN partition_name;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Sales
+ALTER TABLE sales RENAME TO sales_unpartitioned;
+ALTER INDEX sales_pkey RENAME TO sales_unpartitioned_pkey;
+DROP INDEX IF EXISTS idx_sales_product_id;
+DROP INDEX IF EXISTS idx_sales_date;
+DROP INDEX IF EXISTS idx_sales_shop_date_created_id;
+
+CREATE TABLE sales (
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    shop_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    date DATE NOT NULL,
+    buying_price DECIMAL(10,2) NOT NULL,
+    selling_price DECIMAL(10,2) NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT positive_quantity CHECK (quantity > 0),
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
+
+SELECT ensure_monthly_partition('sales', month::date)
+FROM generate_series(
+    date_trunc('month', LEAST(COALESCE((SELECT MIN(date) FROM sales_unpartitioned), CURRENT_DATE), CURRENT_DATE)),
+    date_trunc('month', GREATEST(COALESCE((SELECT MAX(date) FROM sales_unpartitioned), CURRENT_DATE), CURRENT_DATE))
+        + INTERVAL '3 months',
+    INTERVAL '1 month'
+) AS month;
+
+INSERT INTO sales (id, shop_id, product_id, quantity, date, buying_price, selling_price, created_at)
+SELECT id, shop_id, product_id, quantity, date, buying_price, selling_price, created_at
+FROM sales_unpartitioned;
+
+DROP TABLE sales_unpartitioned;
+
+CREATE INDEX idx_sales_product_id ON sales (product_id);
+CREATE INDEX idx_sales_date ON sales (date);
+CREATE INDEX idx_sales_shop_date_created_id
+    ON sales (shop_id, date DESC, created_at DESC, id DESC) INCLUDE (product_id, quantity);
+
+-- Stock
+ALTER TABLE stock RENAME TO stock_unpartitioned;
+ALTER INDEX stock_pkey RENAME TO stock_unpartitioned_pkey;
+DROP INDEX IF EXISTS idx_stock_product_id;
+DROP INDEX IF EXISTS idx_stock_date;
+DROP INDEX IF EXISTS idx_stock_shop_product_date;
+
+CREATE TABLE stock (
+    id UUID NOT NULL DEFAULT uuid_generate_v4(),
+    shop_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    date DATE NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT positive_quantity CHECK (quantity >= 0),
+    PRIMARY KEY (id, date)
+) PARTITION BY RANGE (date);
+
+SELECT ensure_monthly_partition('stock', month::date)
+FROM generate_series(
+    date_trunc('month', LEAST(COALESCE((SELECT MIN(date) FROM stock_unpartitioned), CURRENT_DATE), CURRENT_DATE)),
+    date_trunc('month', GREATEST(COALESCE((SELECT MAX(date) FROM stock_unpartitioned), CURRENT_DATE), CURRENT_DATE))
+        + INTERVAL '3 months',
+    INTERVAL '1 month'
+) AS month;
+
+INSERT INTO stock (id, shop_id, product_id, quantity, date, created_at)
+SELECT id, shop_id, product_id, quantity, date, created_at
+FROM stock_unpartitioned;
+
+DROP TABLE stock_unpartitioned;
+
+CREATE INDEX idx_stock_product_id ON stock (product_id);
+CREATE INDEX idx_stock_date ON stock (date);
+CREATE INDEX idx_stock_shop_product_date ON stock (shop_id, product_id, date);
@@ -0,0 +1,18 @@
+-- Backfill sales_daily_summary from the existing sales history, so dashboards
+-- and reports on databases that predate the summary are not left at zero.
+-- Same computation as reports.REBUILD_SUMMARY_SQL for all shops.
+
+LOCK TABLE sales_daily_summary IN SHARE ROW EXCLUSIVE MODE;
+
+DELETE FROM sales_daily_summary;
+
+INSERT INTO sales_daily_summary
+    (shop_id, product_id, date, sales_count, quantity, revenue, cost, profit)
+SELECT s.shop_id, s.product_id, s.date,
+       COUNT(*),
+       SUM(s.quantity),
+       SUM(s.selling_price * s.quantity),
+       SUM(s.buying_price * s.quantity),
+       SUM((s.selling_price - s.buying_price) * s.quantity)
+FROM sales s
+GROUP BY s.shop_id, s.product_id, s.date;
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Partition maintenance for Pima app with NeonDB PostgreSQL
+sales and stock are range-partitioned by month on date (migration 0005).
+Write paths call ensure_partitions before inserting so any month they touch
+exists; run this script from cron to create months ahead of time and to
+detach old months for archiving.
+
+Detached months keep their data as standalone tables (e.g. sales_y2023m01)
+but drop out of the detail report, the CSV export and rebuild_summary.py /
+rebuild_inventory.py, which recompute from the attached months only.
+"""
+
+import argparse
+import os
+import threading
+from datetime import date, datetime
+from typing import Iterable, List
+from dotenv import load_dotenv
+from db import execute_query, transaction
+
+# Load environment variables
+load_dotenv()
+
+PARTITIONED_TABLES = ('sales', 'stock')
+MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+
+# (table, first day of month) pairs known to have a partition in this process
+_known_months = set()
+_known_lock = threading.Lock()
+
+def month_start(day: date) -> date:
+    """First day of the month containing day."""
+    return day.replace(day=1)
+
+def add_months(month: date, count: int) -> date:
+    """First day of the month count months after month."""
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def ensure_partitions(table: str, dates: Iterable[date]):
+    """
+    Make sure table has a partition for the month of every date.
+    Runs in its own committed transaction so a rolled-back write never
+    leaves this process believing a month exists; known months are skipped.
+    """
+    if table not in PARTITIONED_TABLES:
+        raise ValueError(f"Unknown partitioned table '{table}'")
+    
+    months = {month_start(day) for day in dates}
+    with _known_lock:
+        missing = sorted(month for month in months if (table, month) not in _known_months)
+    if not missing:
+        return
+    
+    with transaction() as cur:
+        for month in missing:
+            cur.execute("SELECT ensure_monthly_partition(%s, %s)", (table, month))
+    
+    with _known_lock:
+        _known_months.update((table, month) for month in missing)
+
+def create_future_partitions(months_ahead: int = MONTHS_AHEAD) -> int:
+    """Create partitions from this month to months_ahead months ahead. Returns months covered."""
+    this_month = month_start(date.today())
+    months = [add_months(this_month, i) for i in range(months_ahead + 1)]
+    for table in PARTITIONED_TABLES:
+        ensure_partitions(table, months)
+    return len(months)
+
+def list_partitions(table: str) -> List[dict]:
+    """Attached partitions of table with their month, oldest first."""
+    return execute_query(
+        """
+        SELECT c.relname AS name,
+               to_date(substring(c.relname from '_y(\\d{4}m\\d{2})$'), 'YYYY"m"MM') AS month
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+        ORDER BY month
+        """,
+        (table,),
+        fetch=True
+    )
+
+def detach_partitions_before(cutoff: date, dry_run: bool = False) -> List[str]:
+    """
+    Detach every monthly partition for a month before cutoff's month.
+    Returns the detached partition names.
+    """
+    cutoff = month_start(cutoff)
+    detached = []
+    for table in PARTITIONED_TABLES:
+        for partition in list_partitions(table):
+            if partition['month'] is None or partition['month'] >= cutoff:
+                continue
+            if not dry_run:
+                execute_query(f'ALTER TABLE "{table}" DETACH PARTITION "{partition["name"]}"')
+                with _known_lock:
+                    _known_months.discard((table, partition['month']))
+            detached.append(partition['name'])
+    return detached
+
+def maintain_partitions(months_ahead: int, detach_before: date = None, dry_run: bool = False) -> bool:
+    """Create upcoming partitions and optionally detach old ones, printing progress."""
+    if not os.getenv("DATABASE_URL"):
+        print("ERROR: DATABASE_URL environment variable is not set!")
+        return False
+    
+    try:
+        print("Connecting to NeonDB PostgreSQL...")
+        if not dry_run:
+            covered = create_future_partitions(months_ahead)
+            print(f"✅ Partitions exist for this month and {covered - 1} month(s) ahead!")
+        
+        if detach_before:
+            names = detach_partitions_before(detach_before, dry_run)
+            action = "Would detach" if dry_run else "Detached"
+            if names:
+                print(f"✅ {action} {len(names)} partition(s) before {detach_before:%Y-%m}:")
+                for name in names:
+                    print(f"   {name}")
+            else:
+                print(f"✅ No partitions before {detach_before:%Y-%m}.")
+        return True
+    
+    except Exception as e:
+        print(f"ERROR: Failed to maintain partitions: {e}")
+        return False
+
+def parse_month(value: str) -> date:
+    """Parse a YYYY-MM command line month."""
+    return datetime.strptime(value, "%Y-%m").date()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Create upcoming monthly partitions and detach old ones.")
+    parser.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD,
+                        help="Months after this one to create (defaults to PARTITION_MONTHS_AHEAD)")
+    parser.add_argument("--detach-before", type=parse_month,
+                        help="Detach months before this one (YYYY-MM) for archiving")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the months that would be detached")
+    args = parser.parse_args()
+    
+    print("🗓️  Maintaining Pima Partitions...")
+    print("=" * 50)
+    
+    success = maintain_partitions(args.months_ahead, args.detach_before, args.dry_run)
+    
+    if success:
+        print("\n" + "=" * 50)
+        print("🎉 Partition maintenance completed!")
+    else:
+        print("\n❌ Partition maintenance failed!")
+        print("Please check the error messages above and try again.")
+        raise SystemExit(1)
@@ -0,0 +1,147 @@
+"""
+Password hashing for Pima app.
+
+bcrypt is deliberately slow, and running it on the Streamlit script thread
+lets a burst of sign-ins stall page renders for everyone on the process.
+Hashes run on a small worker pool instead. Admission is bounded: once
+PASSWORD_HASH_WORKERS are busy and PASSWORD_HASH_QUEUE_LIMIT more are
+waiting, new requests fail fast with HashBusy so the caller can ask the
+user to try again. A hash still unfinished after PASSWORD_HASH_TIMEOUT
+raises HashBusy too.
+"""
+
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional
+
+import bcrypt
+
+from metrics import metrics
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "16"))
+PASSWORD_HASH_TIMEOUT = float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+
+BUSY_MESSAGE = "The server is busy, please try again in a moment"
+
+_COST_RE = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+
+class HashBusy(Exception):
+    """Raised when the hashing pool is saturated or a queued hash timed out."""
+
+
+class PasswordHasher:
+    """Runs bcrypt on a bounded worker pool."""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT,
+                 rounds: int = BCRYPT_ROUNDS, timeout: float = PASSWORD_HASH_TIMEOUT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.rounds = rounds
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pima-bcrypt')
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._running = 0
+        self._rejected = 0
+
+    def _run(self, operation: str, func, *args):
+        """Run func on the pool, timing it, or raise HashBusy if no slot is free or it times out."""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._rejected += 1
+            metrics.increment('pima_password_hash_rejections_total',
+                              'Password hash requests rejected because the pool was saturated.')
+            raise HashBusy(BUSY_MESSAGE)
+
+        with self._lock:
+            self._admitted += 1
+
+        def task():
+            with self._lock:
+                self._running += 1
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                metrics.observe('pima_password_hash_duration_seconds', 'bcrypt time, by operation.',
+                                time.perf_counter() - started, f'operation="{operation}"')
+                with self._lock:
+                    self._running -= 1
+                    self._admitted -= 1
+                self._slots.release()
+
+        future = self._executor.submit(task)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            if future.cancel():
+                # Never started, so task's cleanup will not run
+                with self._lock:
+                    self._admitted -= 1
+                self._slots.release()
+            metrics.increment('pima_password_hash_timeouts_total',
+                              'Password hash requests that did not finish within the timeout.')
+            raise HashBusy(BUSY_MESSAGE) from None
+
+    def hash(self, password: str) -> str:
+        """Hash a password with the configured cost."""
+        return self._run('hash', lambda: bcrypt.hashpw(
+            password.encode('utf-8'), bcrypt.gensalt(rounds=self.rounds)
+        ).decode('utf-8'))
+
+    def verify(self, password: str, hashed: str) -> bool:
+        """Verify a password against its hash."""
+        return self._run('verify', lambda: bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8')))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """Whether a stored hash was made with a different cost than configured."""
+        return hash_cost(hashed) != self.rounds
+
+    def stats(self) -> dict:
+        """Queue depth and counters for monitoring."""
+        with self._lock:
+            return {
+                'in_flight': self._admitted,
+                'running': self._running,
+                'queued': self._admitted - self._running,
+                'rejected': self._rejected,
+                'workers': self.workers,
+                'queue_limit': self.queue_limit,
+            }
+
+
+def hash_cost(hashed: str) -> Optional[int]:
+    """Cost factor encoded in a bcrypt hash, or None if it is not one."""
+    match = _COST_RE.match(hashed or '')
+    return int(match.group(1)) if match else None
+
+
+# Process-wide pool shared by all sessions
+password_hasher = PasswordHasher()
+
+metrics.register_gauge('pima_password_hash_queue_depth', 'Password hashes waiting for a worker.',
+                       lambda: password_hasher.stats()['queued'])
+metrics.register_gauge('pima_password_hash_running', 'Password hashes currently running.',
+                       lambda: password_hasher.stats()['running'])
+
+
+def hash_password(password: str) -> str:
+    """Hash a password using bcrypt on the shared pool."""
+    return password_hasher.hash(password)
+
+
+def verify_password(password: str, hashed: str) -> bool:
+    """Verify a password against its hash on the shared pool."""
+    return password_hasher.verify(password, hashed)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """Whether a stored hash should be upgraded to the configured cost."""
+    return password_hasher.needs_rehash(hashed)
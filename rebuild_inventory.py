@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Inventory rebuild script for Pima app with NeonDB PostgreSQL
+Run this script to backfill or rebuild the inventory_balances table
+from the raw stock and sales history.
+"""
+
+import argparse
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+def rebuild_inventory(shop_id: str = None):
+    """Rebuild inventory balances for one shop or for all shops."""
+    if not os.getenv("DATABASE_URL"):
+        print("ERROR: DATABASE_URL environment variable is not set!")
+        return False
+    
+    try:
+        from inventory import rebuild_balances
+        
+        print("Connecting to NeonDB PostgreSQL...")
+        scope = f"shop {shop_id}" if shop_id else "all shops"
+        print(f"Rebuilding inventory_balances for {scope}...")
+        rows = rebuild_balances(shop_id)
+        
+        print(f"✅ Wrote {rows} balance rows!")
+        return True
+    
+    except Exception as e:
+        print(f"ERROR: Failed to rebuild inventory: {e}")
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill or rebuild inventory balances.")
+    parser.add_argument("--shop-id", help="Only rebuild this shop (defaults to all shops)")
+    args = parser.parse_args()
+    
+    print("📦 Rebuilding Pima Inventory Balances...")
+    print("=" * 50)
+    
+    success = rebuild_inventory(args.shop_id)
+    
+    if success:
+        print("\n" + "=" * 50)
+        print("🎉 Inventory rebuild completed!")
+    else:
+        print("\n❌ Inventory rebuild failed!")
+        print("Please check the error messages above and try again.")
+        raise SystemExit(1)
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Summary rebuild script for Pima app with NeonDB PostgreSQL
+Run this script to backfill or rebuild the sales_daily_summary table
+from the raw sales history.
+"""
+
+import argparse
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+def rebuild_summary(shop_id: str = None):
+    """Rebuild the daily sales summary for one shop or for all shops."""
+    if not os.getenv("DATABASE_URL"):
+        print("ERROR: DATABASE_URL environment variable is not set!")
+        return False
+    
+    try:
+        from reports import rebuild_daily_summary
+        
+        print("Connecting to NeonDB PostgreSQL...")
+        scope = f"shop {shop_id}" if shop_id else "all shops"
+        print(f"Rebuilding sales_daily_summary for {scope}...")
+        rows = rebuild_daily_summary(shop_id)
+        
+        print(f"✅ Wrote {rows} summary rows!")
+        return True
+        
+    except Exception as e:
+        print(f"ERROR: Failed to rebuild summary: {e}")
+        return False
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill or rebuild the daily sales summary.")
+    parser.add_argument("--shop-id", help="Only rebuild this shop (defaults to all shops)")
+    args = parser.parse_args()
+    
+    print("📊 Rebuilding Pima Sales Summary...")
+    print("=" * 50)
+    
+    success = rebuild_summary(args.shop_id)
+    
+    if success:
+        print("\n" + "=" * 50)
+        print("🎉 Summary rebuild completed!")
+    else:
+        print("\n❌ Summary rebuild failed!")
+        print("Please check the error messages above and try again.")
+        raise SystemExit(1)
@@ -0,0 +1,364 @@
+"""
+Sales report aggregation for Pima app.
+
+Revenue, cost and profit are summed by PostgreSQL so only the aggregates
+cross the wire; pandas only sees one row per day and one row per product.
+Reports read the sales_daily_summary table, which record_sale keeps current
+and rebuild_summary.py can regenerate from raw sales. Each sales row carries
+the unit prices it was sold at, so profit never depends on today's product
+prices and only the product name needs the products table.
+"""
+
+import calendar
+import os
+from datetime import date, timedelta
+from typing import Optional, Tuple
+
+import pandas as pd
+
+from db import execute_query, fetch_frame
+
+DAILY_COLUMNS = ['date', 'sales_count', 'quantity', 'revenue', 'cost', 'profit']
+PRODUCT_COLUMNS = ['product_id', 'name', 'sales_count', 'quantity', 'revenue', 'cost', 'profit']
+MONEY_COLUMNS = ['revenue', 'cost', 'profit']
+DETAIL_COLUMNS = ['date', 'name', 'buying_price', 'selling_price', 'quantity', 'profit']
+
+# Rows per page in the View Reports detail table
+REPORT_PAGE_SIZE = int(os.getenv("REPORT_PAGE_SIZE", "50"))
+
+# Detail table sort orders: leading (expression, type) ahead of the unique
+# (date, created_at, id) tie-break that every keyset cursor ends with
+DETAIL_SORTS = {
+    'date': [],
+    'quantity': [('s.quantity', 'integer')],
+    'profit': [('(s.selling_price - s.buying_price) * s.quantity', 'numeric')],
+}
+DETAIL_TIEBREAK = [('s.date', 'date'), ('s.created_at', 'timestamptz'), ('s.id', 'uuid')]
+
+# Row-level sales for the View Reports detail table and CSV export
+SALES_REPORT_SQL = """
+    SELECT s.date, p.name, s.buying_price, s.selling_price, s.quantity,
+           (s.selling_price - s.buying_price) * s.quantity AS profit
+    FROM sales s
+    JOIN products p ON s.product_id = p.id
+    WHERE s.shop_id = %s AND s.date >= %s AND s.date <= %s
+      AND (%s::uuid IS NULL OR s.product_id = %s::uuid)
+    ORDER BY s.date DESC, s.created_at DESC
+"""
+
+# Adds incoming summary rows onto any existing row for the same shop/day/product
+SUMMARY_CONFLICT_SQL = """
+    ON CONFLICT (shop_id, date, product_id) DO UPDATE SET
+        sales_count = d.sales_count + EXCLUDED.sales_count,
+        quantity = d.quantity + EXCLUDED.quantity,
+        revenue = d.revenue + EXCLUDED.revenue,
+        cost = d.cost + EXCLUDED.cost,
+        profit = d.profit + EXCLUDED.profit,
+        updated_at = CURRENT_TIMESTAMP
+"""
+
+# Insert a batch of (shop_id, product_id, quantity, date) sales, expanded by
+# execute_values, with the product's current unit prices copied onto each row,
+# and upsert their day/product summary rows in one atomic statement. Lines are
+# grouped first because one INSERT ... ON CONFLICT cannot update the same row
+# twice. An unknown product leaves the prices NULL and fails the insert.
+RECORD_SALES_SQL = """
+    WITH new_sales AS (
+        INSERT INTO sales (shop_id, product_id, quantity, date, buying_price, selling_price)
+        SELECT v.shop_id::uuid, v.product_id::uuid, v.quantity, v.date, p.buying_price, p.selling_price
+        FROM (VALUES %s) AS v (shop_id, product_id, quantity, date)
+        LEFT JOIN products p ON p.id = v.product_id::uuid
+        RETURNING shop_id, product_id, quantity, date, buying_price, selling_price
+    )
+    INSERT INTO sales_daily_summary AS d
+        (shop_id, product_id, date, sales_count, quantity, revenue, cost, profit)
+    SELECT n.shop_id, n.product_id, n.date,
+           COUNT(*),
+           SUM(n.quantity),
+           SUM(n.selling_price * n.quantity),
+           SUM(n.buying_price * n.quantity),
+           SUM((n.selling_price - n.buying_price) * n.quantity)
+    FROM new_sales n
+    GROUP BY n.shop_id, n.product_id, n.date
+""" + SUMMARY_CONFLICT_SQL
+
+# Recompute summary rows from raw sales; the shop filter is optional.
+# The lock makes concurrent record_sale calls wait rather than double count.
+REBUILD_SUMMARY_SQL = """
+    LOCK TABLE sales_daily_summary IN SHARE ROW EXCLUSIVE MODE;
+    DELETE FROM sales_daily_summary WHERE (%(shop_id)s::uuid IS NULL OR shop_id = %(shop_id)s::uuid);
+    INSERT INTO sales_daily_summary
+        (shop_id, product_id, date, sales_count, quantity, revenue, cost, profit)
+    SELECT s.shop_id, s.product_id, s.date,
+           COUNT(*),
+           SUM(s.quantity),
+           SUM(s.selling_price * s.quantity),
+           SUM(s.buying_price * s.quantity),
+           SUM((s.selling_price - s.buying_price) * s.quantity)
+    FROM sales s
+    WHERE (%(shop_id)s::uuid IS NULL OR s.shop_id = %(shop_id)s::uuid)
+    GROUP BY s.shop_id, s.product_id, s.date;
+"""
+
+# Trend buckets, finest first, with the longest range (in days) each is used for
+TREND_BUCKETS = [('day', 92), ('week', 730), ('month', None)]
+
+# One round trip over the summary: per-bucket rows, per-product rows and the
+# grand total. Summary days are truncated to the trend bucket (day, week or
+# month) before grouping, so long ranges return a handful of points.
+AGGREGATE_SQL = """
+    SELECT
+        GROUPING(d.date) AS by_date_rollup,
+        GROUPING(p.id, p.name) AS by_product_rollup,
+        d.date,
+        p.id AS product_id,
+        p.name,
+        COALESCE(SUM(d.sales_count), 0) AS sales_count,
+        COALESCE(SUM(d.quantity), 0) AS quantity,
+        COALESCE(SUM(d.revenue), 0) AS revenue,
+        COALESCE(SUM(d.cost), 0) AS cost,
+        COALESCE(SUM(d.profit), 0) AS profit
+    FROM (
+        SELECT date_trunc(%s, date::timestamp)::date AS date, product_id,
+               sales_count, quantity, revenue, cost, profit
+        FROM sales_daily_summary
+        WHERE shop_id = %s AND date >= %s AND date <= %s
+          AND (%s::uuid IS NULL OR product_id = %s::uuid)
+    ) d
+    JOIN products p ON d.product_id = p.id
+    GROUP BY GROUPING SETS ((d.date), (p.id, p.name), ())
+"""
+
+# Dashboard comparisons as (period, label), in display order. Each compares a
+# current window ending on the selected day with the window before it:
+#   day   - the day vs the day before
+#   week  - the last 7 days vs the 7 days before
+#   month - month to date vs the same days of last month
+#   year  - month to date vs the same days a year earlier
+COMPARISON_PERIODS = [
+    ('day', "vs Previous Day"),
+    ('week', "Last 7 Days vs Prior 7"),
+    ('month', "Month to Date vs Last Month"),
+    ('year', "Month to Date vs Last Year"),
+]
+COMPARISON_COLUMNS = ['period', 'revenue', 'previous_revenue', 'profit', 'previous_profit',
+                      'quantity', 'previous_quantity']
+PRODUCT_COMPARISON_COLUMNS = ['period', 'product_id', 'name', 'profit', 'previous_profit', 'profit_change',
+                              'quantity', 'previous_quantity']
+
+# Every comparison in one round trip: each period contributes a current and a
+# previous window, windows are joined to the summary once, FILTER splits the
+# sums by side and the grouping sets give per-period totals plus per-product rows
+COMPARISON_SQL = """
+    WITH periods AS (
+        SELECT *
+        FROM unnest(%s::text[], %s::date[], %s::date[], %s::date[], %s::date[])
+            AS r (period, current_start, current_end, previous_start, previous_end)
+    ),
+    windows AS (
+        SELECT period, TRUE AS is_current, current_start AS start_date, current_end AS end_date FROM periods
+        UNION ALL
+        SELECT period, FALSE, previous_start, previous_end FROM periods
+    ),
+    compared AS (
+        SELECT
+            GROUPING(d.product_id) AS by_product_rollup,
+            w.period,
+            d.product_id,
+            COALESCE(SUM(d.revenue) FILTER (WHERE w.is_current), 0) AS revenue,
+            COALESCE(SUM(d.revenue) FILTER (WHERE NOT w.is_current), 0) AS previous_revenue,
+            COALESCE(SUM(d.profit) FILTER (WHERE w.is_current), 0) AS profit,
+            COALESCE(SUM(d.profit) FILTER (WHERE NOT w.is_current), 0) AS previous_profit,
+            COALESCE(SUM(d.quantity) FILTER (WHERE w.is_current), 0) AS quantity,
+            COALESCE(SUM(d.quantity) FILTER (WHERE NOT w.is_current), 0) AS previous_quantity
+        FROM windows w
+        JOIN sales_daily_summary d
+          ON d.shop_id = %s AND d.date >= w.start_date AND d.date <= w.end_date
+        GROUP BY GROUPING SETS ((w.period), (w.period, d.product_id))
+    )
+    SELECT c.*, c.profit - c.previous_profit AS profit_change, p.name
+    FROM compared c
+    LEFT JOIN products p ON p.id = c.product_id
+    ORDER BY c.period, abs(c.profit - c.previous_profit) DESC, p.name
+"""
+
+
+def _typed(df: pd.DataFrame, columns: list) -> pd.DataFrame:
+    """Select aggregate columns with fixed dtypes, even when there are no rows."""
+    df = df.reindex(columns=columns).reset_index(drop=True)
+    for col in MONEY_COLUMNS:
+        df[col] = df[col].astype(float)
+    df['sales_count'] = df['sales_count'].astype('int64')
+    df['quantity'] = df['quantity'].astype('int64')
+    return df
+
+
+def empty_totals() -> dict:
+    """Totals for a range with no sales."""
+    return {'sales_count': 0, 'quantity': 0, 'revenue': 0.0, 'cost': 0.0, 'profit': 0.0}
+
+
+def choose_bucket(start_date: date, end_date: date) -> str:
+    """Coarsest trend bucket needed to keep a date range readable."""
+    days = (end_date - start_date).days + 1
+    for bucket, max_days in TREND_BUCKETS:
+        if max_days is None or days <= max_days:
+            return bucket
+    return TREND_BUCKETS[-1][0]
+
+
+def _shift_months(day: date, months: int) -> date:
+    """The same day `months` months away, clamped to the end of shorter months."""
+    index = day.year * 12 + day.month - 1 + months
+    year, month = index // 12, index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def comparison_ranges(target_date: date) -> list:
+    """(period, current_start, current_end, previous_start, previous_end) for COMPARISON_PERIODS."""
+    month_start = target_date.replace(day=1)
+    return [
+        ('day', target_date, target_date,
+         target_date - timedelta(days=1), target_date - timedelta(days=1)),
+        ('week', target_date - timedelta(days=6), target_date,
+         target_date - timedelta(days=13), target_date - timedelta(days=7)),
+        ('month', month_start, target_date,
+         _shift_months(month_start, -1), _shift_months(target_date, -1)),
+        ('year', month_start, target_date,
+         _shift_months(month_start, -12), _shift_months(target_date, -12)),
+    ]
+
+
+def empty_aggregates(bucket: str = 'day') -> dict:
+    """Aggregates for a range with no sales."""
+    return {
+        'bucket': bucket,
+        'totals': empty_totals(),
+        'daily': _typed(pd.DataFrame(), DAILY_COLUMNS),
+        'products': _typed(pd.DataFrame(), PRODUCT_COLUMNS),
+    }
+
+
+def aggregate_sales(shop_id: str, start_date: date, end_date: date,
+                    product_id: Optional[str] = None, bucket: Optional[str] = None,
+                    replica: bool = False) -> dict:
+    """
+    Aggregate sales for a shop over a date range.
+    'daily' holds one row per trend bucket (see choose_bucket unless given).
+    Returns {'bucket': str, 'totals': dict, 'daily': DataFrame, 'products': DataFrame}.
+    """
+    bucket = bucket or choose_bucket(start_date, end_date)
+    product_id = str(product_id) if product_id else None
+    rows = fetch_frame(
+        AGGREGATE_SQL,
+        (bucket, shop_id, start_date, end_date, product_id, product_id),
+        replica=replica
+    )
+
+    by_date = rows['by_date_rollup'] == 0
+    by_product = rows['by_product_rollup'] == 0
+
+    totals = empty_totals()
+    total_rows = rows[~by_date & ~by_product]
+    if not total_rows.empty and total_rows['sales_count'].iloc[0]:
+        total = total_rows.iloc[0]
+        totals = {
+            'sales_count': int(total['sales_count']),
+            'quantity': int(total['quantity']),
+            'revenue': float(total['revenue']),
+            'cost': float(total['cost']),
+            'profit': float(total['profit']),
+        }
+
+    daily = _typed(rows[by_date & ~by_product].sort_values('date'), DAILY_COLUMNS)
+    products = _typed(rows[~by_date & by_product].sort_values('profit', ascending=False), PRODUCT_COLUMNS)
+
+    return {'bucket': bucket, 'totals': totals, 'daily': daily, 'products': products}
+
+
+def sales_detail_page(shop_id: str, start_date: date, end_date: date, product_id: Optional[str] = None,
+                      sort: str = 'date', descending: bool = True, after: Optional[tuple] = None,
+                      page_size: int = REPORT_PAGE_SIZE,
+                      replica: bool = False) -> Tuple[pd.DataFrame, Optional[tuple]]:
+    """
+    Fetch one page of the row-level sales report using keyset pagination.
+    `after` is the cursor returned with the previous page (None for the first).
+    Returns (page, cursor for the next page or None on the last page).
+    """
+    keys = DETAIL_SORTS[sort] + DETAIL_TIEBREAK
+    direction = 'DESC' if descending else 'ASC'
+    product_id = str(product_id) if product_id else None
+    params = [shop_id, start_date, end_date, product_id, product_id]
+
+    # Every key is compared in the same direction, so one row comparison
+    # picks up exactly where the previous page ended
+    keyset_sql = ''
+    if after is not None:
+        keyset_sql = "AND ({}) {} ({})".format(
+            ', '.join(expr for expr, _ in keys),
+            '<' if descending else '>',
+            ', '.join(f'%s::{sql_type}' for _, sql_type in keys)
+        )
+        params.extend(after)
+
+    query = f"""
+        SELECT s.date, p.name, s.buying_price, s.selling_price, s.quantity,
+               (s.selling_price - s.buying_price) * s.quantity AS profit,
+               ARRAY[{', '.join(f'({expr})::text' for expr, _ in keys)}] AS sort_key
+        FROM sales s
+        JOIN products p ON s.product_id = p.id
+        WHERE s.shop_id = %s AND s.date >= %s AND s.date <= %s
+          AND (%s::uuid IS NULL OR s.product_id = %s::uuid)
+          {keyset_sql}
+        ORDER BY {', '.join(f'{expr} {direction}' for expr, _ in keys)}
+        LIMIT %s
+    """
+    # One extra row tells us whether there is a next page
+    params.append(page_size + 1)
+    rows = fetch_frame(query, tuple(params), replica=replica)
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows.iloc[:page_size]
+        next_cursor = tuple(rows['sort_key'].iloc[-1])
+    return rows.reindex(columns=DETAIL_COLUMNS), next_cursor
+
+
+def rebuild_daily_summary(shop_id: Optional[str] = None) -> int:
+    """
+    Rebuild sales_daily_summary from raw sales in a single transaction.
+    Returns the number of summary rows written.
+    """
+    return execute_query(REBUILD_SUMMARY_SQL, {'shop_id': shop_id})
+
+
+def empty_comparison() -> dict:
+    """Comparisons for a shop with no sales in any window."""
+    periods = pd.DataFrame(0.0, index=[period for period, _ in COMPARISON_PERIODS],
+                           columns=COMPARISON_COLUMNS[1:])
+    periods.index.name = 'period'
+    return {'periods': periods, 'products': pd.DataFrame(columns=PRODUCT_COMPARISON_COLUMNS)}
+
+
+def compare_periods(shop_id: str, target_date: date, replica: bool = False) -> dict:
+    """
+    Compare the windows ending on target_date with the ones before them (see
+    COMPARISON_PERIODS) in a single query.
+    Returns {'periods': DataFrame indexed by period, 'products': DataFrame}.
+    """
+    ranges = comparison_ranges(target_date)
+    rows = fetch_frame(
+        COMPARISON_SQL,
+        tuple(list(column) for column in zip(*ranges)) + (shop_id,),
+        replica=replica
+    )
+
+    by_product = rows['by_product_rollup'] == 0
+    periods = rows[~by_product].reindex(columns=COMPARISON_COLUMNS).set_index('period')
+    # Periods with no sales on either side have no row
+    periods = periods.reindex([period for period, _ in COMPARISON_PERIODS]).fillna(0).astype(float)
+
+    # Biggest profit swings first within each period
+    products = rows[by_product].reindex(columns=PRODUCT_COMPARISON_COLUMNS).reset_index(drop=True)
+
+    return {'periods': periods, 'products': products}
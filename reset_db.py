@@ -8,6 +8,7 @@ WARNING: This will delete all data!
 import os
 import psycopg2
 from dotenv import load_dotenv
+from init_db import apply_migrations
 
 # Load environment variables
 load_dotenv()
@@ -34,12 +35,18 @@ def reset_database():
         # Drop existing tables in correct order (respecting foreign keys)
         print("Dropping existing tables...")
         drop_sql = """
+        DROP TABLE IF EXISTS write_receipts CASCADE;
+        DROP TABLE IF EXISTS sessions CASCADE;
+        DROP TABLE IF EXISTS inventory_balances CASCADE;
+        DROP TABLE IF EXISTS sales_daily_summary CASCADE;
         DROP TABLE IF EXISTS sales CASCADE;
         DROP TABLE IF EXISTS stock CASCADE;
         DROP TABLE IF EXISTS products CASCADE;
         DROP TABLE IF EXISTS shops CASCADE;
         DROP TABLE IF EXISTS users CASCADE;
+        DROP TABLE IF EXISTS schema_migrations CASCADE;
         DROP FUNCTION IF EXISTS update_updated_at_column() CASCADE;
+        DROP FUNCTION IF EXISTS ensure_monthly_partition(TEXT, DATE) CASCADE;
         """
         
         with conn.cursor() as cur:
@@ -58,6 +65,9 @@ def reset_database():
             cur.execute(schema_sql)
             conn.commit()
         
+        print("Applying migrations...")
+        apply_migrations(conn)
+        
         print("✅ Database schema recreated successfully!")
         print("✅ Your Pima app database has been reset!")
         
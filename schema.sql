@@ -35,6 +35,7 @@ CREATE TABLE IF NOT EXISTS products (
 );
 
 -- Stock table for inventory tracking
+-- migrations/0005 converts stock and sales to monthly range partitions on date
 CREATE TABLE IF NOT EXISTS stock (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     shop_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
@@ -52,21 +53,77 @@ CREATE TABLE IF NOT EXISTS sales (
     product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
     quantity INTEGER NOT NULL DEFAULT 0,
     date DATE NOT NULL,
+    -- Unit prices when the sale was recorded, so later price edits keep history intact
+    buying_price DECIMAL(10,2) NOT NULL,
+    selling_price DECIMAL(10,2) NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     CONSTRAINT positive_quantity CHECK (quantity > 0)
 );
 
+-- Applied schema migrations, managed by init_db.py
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Daily sales summary, maintained on every recorded sale
+-- Dashboards read one row per (shop, product, day) instead of scanning sales
+CREATE TABLE IF NOT EXISTS sales_daily_summary (
+    shop_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    date DATE NOT NULL,
+    sales_count INTEGER NOT NULL DEFAULT 0,
+    quantity INTEGER NOT NULL DEFAULT 0,
+    revenue DECIMAL(14,2) NOT NULL DEFAULT 0.00,
+    cost DECIMAL(14,2) NOT NULL DEFAULT 0.00,
+    profit DECIMAL(14,2) NOT NULL DEFAULT 0.00,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (shop_id, date, product_id)
+);
+
+-- Running stock balance per product, maintained on every stock update and sale
+-- on_hand is stock received minus units sold (see inventory.py)
+CREATE TABLE IF NOT EXISTS inventory_balances (
+    shop_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    product_id UUID NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    stock_in BIGINT NOT NULL DEFAULT 0,
+    sold BIGINT NOT NULL DEFAULT 0,
+    on_hand BIGINT GENERATED ALWAYS AS (stock_in - sold) STORED,
+    low_stock_threshold INTEGER,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (shop_id, product_id),
+    CONSTRAINT non_negative_threshold CHECK (low_stock_threshold >= 0)
+);
+
+-- Persistent sign-in sessions (see sessions.py)
+-- Only a SHA-256 hash of each token is stored; the token lives in a signed cookie
+CREATE TABLE IF NOT EXISTS sessions (
+    token_hash CHAR(64) PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    revoked_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Idempotency keys of journaled writes already applied (see journal.py)
+CREATE TABLE IF NOT EXISTS write_receipts (
+    idempotency_key UUID PRIMARY KEY,
+    shop_id UUID NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    applied_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
 -- Create indexes for better performance
-CREATE INDEX IF NOT EXISTS idx_products_shop_id ON products(shop_id);
-CREATE INDEX IF NOT EXISTS idx_stock_shop_id ON stock(shop_id);
+-- Composite shop indexes are created by migrations/ (see init_db.py)
 CREATE INDEX IF NOT EXISTS idx_stock_product_id ON stock(product_id);
 CREATE INDEX IF NOT EXISTS idx_stock_date ON stock(date);
-CREATE INDEX IF NOT EXISTS idx_sales_shop_id ON sales(shop_id);
 CREATE INDEX IF NOT EXISTS idx_sales_product_id ON sales(product_id);
 CREATE INDEX IF NOT EXISTS idx_sales_date ON sales(date);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);
+CREATE INDEX IF NOT EXISTS idx_write_receipts_applied_at ON write_receipts(applied_at);
 
--- Create updated_at triggers
+-- Create updated_at triggers (dropped first so the schema can be re-applied)
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
 BEGIN
@@ -75,12 +132,15 @@ BEGIN
 END;
 $$ language 'plpgsql';
 
+DROP TRIGGER IF EXISTS update_users_updated_at ON users;
 CREATE TRIGGER update_users_updated_at BEFORE UPDATE ON users
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+DROP TRIGGER IF EXISTS update_shops_updated_at ON shops;
 CREATE TRIGGER update_shops_updated_at BEFORE UPDATE ON shops
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+DROP TRIGGER IF EXISTS update_products_updated_at ON products;
 CREATE TRIGGER update_products_updated_at BEFORE UPDATE ON products
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
@@ -0,0 +1,108 @@
+"""
+Persistent sign-in sessions for Pima app.
+
+A successful sign-in creates an opaque random token. The browser keeps it in
+a cookie signed with COOKIE_PASSWORD, and the database stores only its
+SHA-256 hash with an expiry. A reload or new tab resumes the session with a
+single primary-key lookup instead of another bcrypt check. Sessions can be
+revoked one at a time or for every device of a user.
+"""
+
+import hashlib
+import hmac
+import os
+import secrets
+from typing import Optional
+
+from db import execute_query, execute_query_one
+
+SESSION_COOKIE_NAME = os.getenv("SESSION_COOKIE_NAME", "pima_session")
+SESSION_TTL_DAYS = int(os.getenv("SESSION_TTL_DAYS", "7"))
+
+
+def _cookie_secret() -> Optional[bytes]:
+    """Signing key for session cookies; persistent sessions are off without it."""
+    secret = os.getenv("COOKIE_PASSWORD")
+    return secret.encode('utf-8') if secret else None
+
+
+def sessions_enabled() -> bool:
+    """Whether persistent sessions are configured."""
+    return _cookie_secret() is not None
+
+
+def _token_hash(token: str) -> str:
+    """Hash stored in the database, so a leaked table does not leak usable tokens."""
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+
+def sign_token(token: str) -> str:
+    """Return the cookie value: the token plus an HMAC signature."""
+    signature = hmac.new(_cookie_secret(), token.encode('utf-8'), hashlib.sha256).hexdigest()
+    return f"{token}.{signature}"
+
+
+def verify_cookie(cookie_value: Optional[str]) -> Optional[str]:
+    """Return the token from a correctly signed cookie value, else None."""
+    if not cookie_value or not sessions_enabled() or '.' not in cookie_value:
+        return None
+    token, signature = cookie_value.rsplit('.', 1)
+    expected = hmac.new(_cookie_secret(), token.encode('utf-8'), hashlib.sha256).hexdigest()
+    return token if hmac.compare_digest(signature, expected) else None
+
+
+def create_session(user_id: str) -> str:
+    """Create a session for a user and return the signed cookie value."""
+    token = secrets.token_urlsafe(32)
+    execute_query(
+        """
+        INSERT INTO sessions (token_hash, user_id, expires_at)
+        VALUES (%s, %s, CURRENT_TIMESTAMP + make_interval(days => %s))
+        """,
+        (_token_hash(token), user_id, SESSION_TTL_DAYS)
+    )
+    # Keep the table small: drop this user's sessions that ended over a day ago
+    execute_query(
+        """
+        DELETE FROM sessions
+        WHERE user_id = %s AND COALESCE(revoked_at, expires_at) < CURRENT_TIMESTAMP - INTERVAL '1 day'
+        """,
+        (user_id,)
+    )
+    return sign_token(token)
+
+
+def resume_session(cookie_value: Optional[str]) -> Optional[dict]:
+    """Return the user for a valid, unexpired and unrevoked session cookie."""
+    token = verify_cookie(cookie_value)
+    if not token:
+        return None
+    return execute_query_one(
+        """
+        SELECT u.id, u.email, s.shop_name
+        FROM sessions se
+        JOIN users u ON u.id = se.user_id
+        LEFT JOIN shops s ON s.id = u.id
+        WHERE se.token_hash = %s AND se.revoked_at IS NULL AND se.expires_at > CURRENT_TIMESTAMP
+        """,
+        (_token_hash(token),)
+    )
+
+
+def revoke_session(cookie_value: Optional[str]) -> bool:
+    """Revoke the session behind a cookie. Returns True if one was revoked."""
+    token = verify_cookie(cookie_value)
+    if not token:
+        return False
+    return execute_query(
+        "UPDATE sessions SET revoked_at = CURRENT_TIMESTAMP WHERE token_hash = %s AND revoked_at IS NULL",
+        (_token_hash(token),)
+    ) > 0
+
+
+def revoke_user_sessions(user_id: str) -> int:
+    """Revoke every active session for a user, e.g. after a password change."""
+    return execute_query(
+        "UPDATE sessions SET revoked_at = CURRENT_TIMESTAMP WHERE user_id = %s AND revoked_at IS NULL",
+        (user_id,)
+    )